@@ -1,40 +1,703 @@
 import os
+import sys
 import subprocess
-import tkinter as tk
-import pandas as pd
-import numpy as np
-import joblib
+import getpass
+import queue
+import threading
+import argparse
+import logging
+import signal
+import mmap
+import struct
+import itertools
+import json
+import hashlib
+import time
+import importlib
+import tempfile
+import contextlib
+import cProfile
+import tracemalloc
 import re
-import chardet
-from concurrent.futures import ThreadPoolExecutor
-from tkinter import ttk, messagebox
-from regipy import RegistryHive
+import bisect
+import csv
+import socket
+from stat import S_ISFIFO
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+try:
+    import tkinter as tk
+    from tkinter import ttk, messagebox
+except ImportError:
+    # Servers often ship Python without Tk; only the GUI needs it
+    tk = ttk = messagebox = None
 from datetime import datetime
 
-from sklearn.preprocessing import MinMaxScaler, RobustScaler
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split, GridSearchCV, StratifiedKFold
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, roc_auc_score
-from sklearn.feature_selection import RFE
+class LazyModule:
+    # Stands in for a heavy module until its first attribute access, then imports it and replaces itself in this
+    # module's globals, so the window and --help come up without loading pandas, numpy or joblib
+    def __init__(self, sModule, sGlobal):
+        self.sModule = sModule
+        self.sGlobal = sGlobal
+
+    def load(self):
+        module = importlib.import_module(self.sModule)
+        globals()[self.sGlobal] = module
+        return module
+
+    def __getattr__(self, sAttr):
+        return getattr(self.load(), sAttr)
+
+pd = LazyModule("pandas", "pd")
+np = LazyModule("numpy", "np")
+joblib = LazyModule("joblib", "joblib")
+
+def importLazyModules():
+    # Loads every module still behind a LazyModule (a loaded one is the module itself, which has no load())
+    for module in (pd, np, joblib):
+        if isinstance(module, LazyModule):
+            module.load()
+
+# regipy is bound on the first parse (importRegipy); sklearn is imported where scalers are fitted
+RegistryHive = NKRecord = Cell = REGF_HEADER_SIZE = RegistryParsingException = None
+
+def importRegipy():
+    global RegistryHive, NKRecord, Cell, REGF_HEADER_SIZE, RegistryParsingException
+    if RegistryHive is None:
+        from regipy.registry import NKRecord, Cell, REGF_HEADER_SIZE
+        from regipy.exceptions import RegistryParsingException
+        from regipy import RegistryHive
+
+# Process memory for the per-stage metrics: (current RSS, peak RSS) in bytes, None where the platform cannot tell
+def readProcessMemory():
+    if sys.platform.startswith("linux"):
+        memory = {}
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    memory[line[:5]] = int(line.split()[1]) * 1024
+        return memory.get("VmRSS"), memory.get("VmHWM")
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (sName, ctypes.c_size_t) for sName in ("PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                                                       "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+        ctypes.windll.psapi.GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.c_void_p, wintypes.DWORD]
+        if ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize, counters.PeakWorkingSetSize
+        return None, None
+    import resource
+    # ru_maxrss is in bytes on macOS
+    return None, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def resetPeakMemory():
+    # Linux lets a process reset its own peak RSS, which makes the peak per stage; elsewhere it is the process peak
+    try:
+        with open("/proc/self/clear_refs", 'w') as f:
+            f.write("5")
+    except OSError:
+        pass
 
 sScriptPath = os.path.dirname(os.path.abspath(__file__))
-sUsername = os.getlogin()
+try:
+    sUsername = os.getlogin()
+except OSError:
+    # No controlling terminal (e.g. services, benchmarks); fall back to the environment
+    sUsername = getpass.getuser()
 sNtuserPath = fr"C:\Users\{sUsername}\ntuser.dat"
+xLogger = logging.getLogger("PARSNIP")
+xSnapshotColumns = ["Key", "Name", "Value", "Type", "Subkey Count", "Value Count", "Key Size", "Depth"]
+xRowColumns = ["Key", "Depth", "Key Size", "Subkey Count", "Value Count", "Name", "Value", "Type"]
 
-class PARSNIP:
-    def __init__(self, root):
-        self.root = root
-        self.bAutoRefresh = False
-        self.xPreviousData = None   # Previous snapshot (list of dicts)
+# Feature category rules, compiled once; the first matching rule wins
+xPathCategoryRules = [
+    ("Startup Path", "Run"),
+    ("Service Path", "Services"),
+    ("Network Path", "Internet Settings")
+]
+xTypeGroups = {
+    "REG_SZ": "String", "REG_EXPAND_SZ": "String", "REG_MULTI_SZ": "String",
+    "REG_DWORD": "Numeric", "REG_QWORD": "Numeric",
+    "REG_BINARY": "Binary",
+    "REG_NONE": "Others", "REG_LINK": "Others", "0": "Others"
+}
+xKeyNameCategoryRules = [
+    (cat, re.compile("|".join(re.escape(k) for k in keys), re.IGNORECASE)) for cat, keys in [
+        ("Run Keys", ["Run", "RunOnce", "RunServices"]),
+        ("Service Keys", ["ImageFileExecutionOptions", "AppInit_DLLs"]),
+        ("Security and Configuration Keys", ["Policies", "Explorer"]),
+        ("Internet and Network Keys", ["ProxyEnable", "ProxyServer"]),
+        ("File Execution Keys", ["ShellExecuteHooks"])
+    ]
+]
+# Prefilter rules applied to changes before inference; the first matching rule wins, so escalations come first.
+# Each rule is (action, rule name, key regex, value name regex, path category, key name category); None matches anything.
+xDefaultChangeRules = [
+    ("deny", "Run keys", r"\\CurrentVersion\\(?:Run|RunOnce|RunServices|RunServicesOnce)(?:\\|$)", None, None, None),
+    ("deny", "Image File Execution Options", r"\\Image File Execution Options(?:\\|$)", None, None, None),
+    ("deny", "AppInit_DLLs", None, r"^AppInit_DLLs$", None, None),
+    ("allow", "Explorer MRU lists", r"\\Explorer\\(?:RecentDocs|ComDlg32|RunMRU|TypedPaths|TypedURLs|WordWheelQuery|FeatureUsage)(?:\\|$)", None, None, None),
+    ("allow", "UserAssist", r"\\Explorer\\UserAssist(?:\\|$)", None, None, None),
+    ("allow", "Shell bags", r"\\Shell\\(?:BagMRU|Bags)(?:\\|$)", None, None, None),
+    ("allow", "Timestamps", None, r"^(?:Last\w*Time|\w*Timestamp)$", None, None)
+]
+xNumericViewColumns = ["Subkey Count", "Value Count", "Key Size", "Depth"]
+nViewBuffer = 5  # Extra lines materialized below the visible window so partial rows never show a gap
+xMinMaxColumns = ['Depth', 'Value Count', 'Value Processed']
+xRobustColumns = ['Key Size', 'Subkey Count']
+# Preprocessed columns that are not model inputs
+xNonFeatureColumns = ['Key', 'Name', 'Value', 'Type', 'Path Category', 'Type Group', 'Key Name Category', 'Label', 'Tactic']
+# RandomForest hyperparameters searched by --train
+xTrainingGrid = {
+    "n_estimators": [100, 300],
+    "max_depth": [None, 20],
+    "min_samples_leaf": [1, 5],
+    "class_weight": [None, "balanced"]
+}
+
+sSnapshotMagic = b"PARSNAP1"
+sBaselineSuffix = ".parsnap"
+sStoreTimestamp = "%Y%m%d_%H%M%S_%f"
+xDeltaFilePattern = re.compile(r"^(base|delta)_(\d{8}_\d{6}_\d{6})\.(csv\.gz|parquet)$")
+
+class RefreshCancelled(Exception):
+    pass
+
+class RegistrySnapshot:
+    # Columnar snapshot of parsed values. Key paths and the key-level stats (Depth, Key Size, Subkey Count,
+    # Value Count) are stored once per key in a key table; each value stores its key id and its Name/Value/Type.
+    # Values of one key are contiguous, starting at xKeyStart[kid]. Build with addKey/addValue, then finalize().
+    def __init__(self):
+        self.xKeys = []
+        self.xKeyStats = []
+        self.xKeyStart = []
+        self.xValueKey = []
+        self.xNames = []
+        self.xValues = []
+        self.xTypes = []
+        self.xStrings = {}
+        self.xRowHashes = None
+
+    @classmethod
+    def fromRows(cls, xData):
+        # Convert a list of row dicts (the legacy layout); a key's stats are taken from its first row
+        snapshot = cls()
+        groups = {}
+        for row in xData:
+            groups.setdefault(row["Key"], []).append(row)
+        for kpath, rows in groups.items():
+            first = rows[0]
+            kid = snapshot.addKey(kpath, first["Depth"], first["Key Size"], first["Subkey Count"], first["Value Count"])
+            for row in rows:
+                snapshot.addValue(kid, row["Name"], row["Value"], row["Type"])
+        return snapshot.finalize()
+
+    @classmethod
+    def fromFrame(cls, df):
+        # Vectorized fromRows for a frame with the xRowColumns; rows are grouped by key, keeping their order
+        snapshot = cls()
+        codes, keys = pd.factorize(df["Key"], use_na_sentinel=False)
+        order = np.argsort(codes, kind='stable')
+        value_key = codes[order]
+        first = np.flatnonzero(np.r_[True, value_key[1:] != value_key[:-1]]) if len(order) else np.arange(0)
+        stats = [df[col].to_numpy(dtype=np.int64)[order[first]] for col in ("Depth", "Key Size", "Subkey Count", "Value Count")]
+        snapshot.xKeys = list(keys)
+        snapshot.xKeyStats = list(zip(*stats))
+        snapshot.xKeyStart = first.tolist()
+        snapshot.xValueKey = value_key.tolist()
+        snapshot.xNames, snapshot.xValues, snapshot.xTypes = (df[col].to_numpy(dtype=object)[order].tolist() for col in ("Name", "Value", "Type"))
+        return snapshot.finalize()
+
+    def addKey(self, kpath, depth, ksize, scount, vcount):
+        self.xKeys.append(kpath)
+        self.xKeyStats.append((depth, ksize, scount, vcount))
+        self.xKeyStart.append(len(self.xNames))
+        return len(self.xKeys) - 1
+
+    def addValue(self, kid, name, value, vtype):
+        # Names and types repeat heavily across a hive, so they are interned
+        self.xValueKey.append(kid)
+        self.xNames.append(self.xStrings.setdefault(name, name))
+        self.xValues.append(value)
+        self.xTypes.append(self.xStrings.setdefault(vtype, vtype))
+
+    def extend(self, other):
+        # Append every key and value of another unfinalized snapshot (a parsed subtree); returns its key id offset
+        offset = len(self.xKeys)
+        nValues = len(self.xNames)
+        self.xKeys.extend(other.xKeys)
+        self.xKeyStats.extend(other.xKeyStats)
+        self.xKeyStart.extend(start + nValues for start in other.xKeyStart)
+        self.xValueKey.extend(kid + offset for kid in other.xValueKey)
+        self.xNames.extend(self.xStrings.setdefault(name, name) for name in other.xNames)
+        self.xValues.extend(other.xValues)
+        self.xTypes.extend(self.xStrings.setdefault(vtype, vtype) for vtype in other.xTypes)
+        return offset
+
+    def copyKey(self, other, kid):
+        # Reuse a key and all of its values from another (finalized) snapshot
+        depth, ksize, scount, vcount = (int(stat[kid]) for stat in (other.xKeyDepth, other.xKeySize, other.xKeySubkeys, other.xKeyValues))
+        new_kid = self.addKey(other.xKeys[kid], depth, ksize, scount, vcount)
+        start, end = other.xKeyStart[kid], other.xKeyStart[kid + 1]
+        self.xValueKey.extend([new_kid] * (end - start))
+        self.xNames.extend(other.xNames[start:end].tolist())
+        self.xValues.extend(other.xValues[start:end].tolist())
+        self.xTypes.extend(other.xTypes[start:end].tolist())
+        return new_kid
+
+    def finalize(self):
+        if self.xKeyStats is None:
+            return self
+        stats = np.array(self.xKeyStats, dtype=np.int32).reshape(-1, 4)
+        self.xKeyDepth, self.xKeySize, self.xKeySubkeys, self.xKeyValues = (stats[:, i].copy() for i in range(4))
+        self.xKeys = np.array(self.xKeys, dtype=object)
+        self.xKeyStart = np.array(self.xKeyStart + [len(self.xNames)], dtype=np.int64)
+        self.xValueKey = np.array(self.xValueKey, dtype=np.int32)
+        self.xNames = np.array(self.xNames, dtype=object)
+        self.xValues = np.array(self.xValues, dtype=object)
+        self.xTypes = np.array(self.xTypes, dtype=object)
+        self.xKeyStats = None
+        self.xStrings = None
+        return self
+
+    def __len__(self):
+        return len(self.xValueKey)
+
+    # Binary columnar file: a JSON header followed by aligned little-endian arrays. Strings are stored as UTF-8
+    # bytes plus offsets; names and types are dictionary-encoded. Numeric columns load as read-only memory maps.
+    def save(self, sPath, meta=None):
+        self.finalize()
+        name_codes, name_dict = pd.factorize(self.xNames)
+        type_codes, type_dict = pd.factorize(self.xTypes)
+        arrays = {
+            "key_depth": self.xKeyDepth.astype('<i4'),
+            "key_size": self.xKeySize.astype('<i4'),
+            "key_subkeys": self.xKeySubkeys.astype('<i4'),
+            "key_values": self.xKeyValues.astype('<i4'),
+            "key_start": self.xKeyStart.astype('<i8'),
+            "value_key": self.xValueKey.astype('<i4'),
+            "name_codes": name_codes.astype('<i4'),
+            "type_codes": type_codes.astype('<i4'),
+            "row_hashes": self.rowHashes().astype('<u8')
+        }
+        for sColumn, values in (("keys", self.xKeys), ("names", name_dict), ("types", type_dict), ("values", self.xValues)):
+            encoded = [(v if isinstance(v, str) else str(v)).encode('utf-8', 'surrogatepass') for v in values]
+            offsets = np.zeros(len(encoded) + 1, dtype='<i8')
+            np.cumsum([len(b) for b in encoded], out=offsets[1:])
+            arrays[f"{sColumn}_offsets"] = offsets
+            arrays[f"{sColumn}_data"] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        columns = {}
+        nOffset = 0
+        for sColumn, array in arrays.items():
+            columns[sColumn] = [array.dtype.str, len(array), nOffset]
+            nOffset += (array.nbytes + 63) & ~63
+        header = json.dumps({"format": 1, "rows": len(self), "keys": len(self.xKeys), "meta": meta or {}, "columns": columns}).encode('utf-8')
+        nDataStart = (len(sSnapshotMagic) + 8 + len(header) + 63) & ~63
+        tmp_path = f"{sPath}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(sSnapshotMagic + struct.pack('<Q', len(header)) + header)
+            for sColumn, array in arrays.items():
+                f.seek(nDataStart + columns[sColumn][2])
+                f.write(array.tobytes())
+            f.truncate(nDataStart + nOffset)
+        os.replace(tmp_path, sPath)
+
+    @classmethod
+    def load(cls, sPath):
+        xMap = np.memmap(sPath, dtype=np.uint8, mode='r')
+        if bytes(xMap[:len(sSnapshotMagic)]) != sSnapshotMagic:
+            raise ValueError(f"{sPath} is not a PARSNIP snapshot file")
+        nHeader = struct.unpack('<Q', bytes(xMap[len(sSnapshotMagic):len(sSnapshotMagic) + 8]))[0]
+        nHeaderStart = len(sSnapshotMagic) + 8
+        header = json.loads(bytes(xMap[nHeaderStart:nHeaderStart + nHeader]))
+        nDataStart = (nHeaderStart + nHeader + 63) & ~63
+        arrays = {}
+        for sColumn, (sDtype, nLength, nOffset) in header["columns"].items():
+            dtype = np.dtype(sDtype)
+            start = nDataStart + nOffset
+            arrays[sColumn] = xMap[start:start + nLength * dtype.itemsize].view(dtype)
+
+        def strings(sColumn):
+            data = arrays[f"{sColumn}_data"].tobytes()
+            offsets = arrays[f"{sColumn}_offsets"].tolist()
+            out = np.empty(len(offsets) - 1, dtype=object)
+            out[:] = [data[a:b].decode('utf-8', 'surrogatepass') for a, b in zip(offsets[:-1], offsets[1:])]
+            return out
+
+        snapshot = cls()
+        snapshot.xKeyStats = None
+        snapshot.xStrings = None
+        snapshot.xKeyDepth, snapshot.xKeySize, snapshot.xKeySubkeys, snapshot.xKeyValues = (arrays[c] for c in ("key_depth", "key_size", "key_subkeys", "key_values"))
+        snapshot.xKeyStart = arrays["key_start"]
+        snapshot.xValueKey = arrays["value_key"]
+        snapshot.xKeys = strings("keys")
+        snapshot.xNames = strings("names")[arrays["name_codes"]]
+        snapshot.xTypes = strings("types")[arrays["type_codes"]]
+        snapshot.xValues = strings("values")
+        snapshot.xRowHashes = arrays["row_hashes"]
+        snapshot.xMeta = header["meta"]
+        return snapshot
+
+    def column(self, sColumn, positions=None):
+        value_key = self.xValueKey if positions is None else self.xValueKey[positions]
+        if sColumn == "Key":
+            return self.xKeys[value_key]
+        if sColumn in ("Depth", "Key Size", "Subkey Count", "Value Count"):
+            stat = {"Depth": self.xKeyDepth, "Key Size": self.xKeySize, "Subkey Count": self.xKeySubkeys, "Value Count": self.xKeyValues}[sColumn]
+            return stat[value_key]
+        values = {"Name": self.xNames, "Value": self.xValues, "Type": self.xTypes}[sColumn]
+        return values if positions is None else values[positions]
+
+    def row(self, pos):
+        kid = self.xValueKey[pos]
+        return {
+            "Key": self.xKeys[kid],
+            "Depth": int(self.xKeyDepth[kid]),
+            "Key Size": int(self.xKeySize[kid]),
+            "Subkey Count": int(self.xKeySubkeys[kid]),
+            "Value Count": int(self.xKeyValues[kid]),
+            "Name": self.xNames[pos],
+            "Value": self.xValues[pos],
+            "Type": self.xTypes[pos]
+        }
+
+    def toFrame(self, positions=None):
+        # Columns are handed to pandas without copying; only the per-key stats are expanded to one entry per value
+        return pd.DataFrame({col: self.column(col, positions) for col in xRowColumns}, copy=False)
+
+    def rowHashes(self):
+        # Stable 64-bit content hash per row over every snapshot field, computed once per snapshot
+        if self.xRowHashes is None:
+            key_hashes = pd.util.hash_array(self.xKeys)
+            for stat in (self.xKeyDepth, self.xKeySize, self.xKeySubkeys, self.xKeyValues):
+                key_hashes = key_hashes * np.uint64(0x100000001B3) ^ pd.util.hash_array(stat)
+            hashes = key_hashes[self.xValueKey]
+            for values in (self.xNames, self.xValues, self.xTypes):
+                hashes = hashes * np.uint64(0x100000001B3) ^ pd.util.hash_array(values)
+            self.xRowHashes = hashes
+        return self.xRowHashes
+
+class SearchIndex:
+    # Built once per snapshot. Each field keeps its distinct lowercased strings, joined into one newline-separated
+    # blob for substring scans (C-level str.find instead of a per-row Python loop), plus a sorted copy for prefix
+    # lookups by bisection. Matches are found per distinct string and then mapped back to rows.
+    def __init__(self, snapshot, fields=("Key", "Name", "Value")):
+        self.nRows = len(snapshot)
+        self.xFields = {}
+        self.xLastSearch = None
+        for field in fields:
+            if field == "Key":
+                # Keys are already distinct in the snapshot's key table
+                codes, uniques = snapshot.xValueKey, snapshot.xKeys
+            else:
+                codes, uniques = pd.factorize(pd.Series(snapshot.column(field), dtype=object).astype(str))
+            lowered = [u.lower() for u in uniques]
+            blob = "\n".join(low.replace("\n", " ") for low in lowered)
+            starts = np.zeros(len(lowered), dtype=np.int64)
+            if lowered:
+                np.cumsum([len(low) + 1 for low in lowered[:-1]], out=starts[1:])
+            # Prefix matching ignores leading backslashes so "software\\microsoft" finds "\\Software\\Microsoft\\..."
+            stripped = [low.lstrip('\\') for low in lowered]
+            order = sorted(range(len(stripped)), key=stripped.__getitem__)
+            self.xFields[field] = {
+                "codes": codes,
+                "lowered": lowered,
+                "blob": blob,
+                "starts": starts,
+                "order": np.array(order, dtype=np.int64),
+                "sorted": [stripped[i] for i in order]
+            }
+
+    def matchSubstring(self, index, kw):
+        blob, starts = index["blob"], index["starts"]
+        ids = []
+        pos = blob.find(kw)
+        while pos != -1:
+            uid = int(np.searchsorted(starts, pos, side='right')) - 1
+            ids.append(uid)
+            # Continue from the next distinct string; one hit per string is enough
+            if uid + 1 >= len(starts):
+                break
+            pos = blob.find(kw, int(starts[uid + 1]))
+        return ids
+
+    def matchRegex(self, index, pattern):
+        # Each distinct string is searched on its own: over the blob, \A and \Z would only match at its ends and
+        # lookarounds would see the neighbouring strings
+        search = pattern.search
+        return [uid for uid, low in enumerate(index["lowered"]) if search(low)]
+
+    def matchPrefix(self, index, kw):
+        kw = kw.lstrip('\\')
+        lo = bisect.bisect_left(index["sorted"], kw)
+        hi = bisect.bisect_left(index["sorted"], kw + '\U0010ffff')
+        return index["order"][lo:hi]
+
+    def search(self, kw, sMode="Substring", fields=None):
+        # Returns the matching row positions in snapshot order; raises re.error for a bad pattern in Regex mode
+        fields = tuple(fields or self.xFields)
+        # The index holds lowercased strings; a regex is compiled as typed (lowering it would turn \D into \d) and
+        # matches case-insensitively instead
+        pattern = re.compile(kw, re.IGNORECASE) if sMode == "Regex" else None
+        kw = kw.lower()
+        last = self.xLastSearch
+        matched = {}
+        for field in fields:
+            index = self.xFields[field]
+            if sMode == "Substring" and last and last[0] == sMode and last[1] == fields and last[2] in kw and len(last[3][field]) < 50000:
+                # Typing extends the previous query, so only its matches can still match
+                lowered = index["lowered"]
+                ids = [uid for uid in last[3][field] if kw in lowered[uid]]
+            elif sMode == "Substring":
+                ids = self.matchSubstring(index, kw)
+            elif sMode == "Prefix":
+                ids = self.matchPrefix(index, kw)
+            else:
+                ids = self.matchRegex(index, pattern)
+            matched[field] = ids
+        self.xLastSearch = (sMode, fields, kw, matched)
+        mask = np.zeros(self.nRows, dtype=bool)
+        for field, ids in matched.items():
+            unique_mask = np.zeros(len(self.xFields[field]["lowered"]), dtype=bool)
+            unique_mask[np.asarray(ids, dtype=np.int64)] = True
+            mask |= unique_mask[self.xFields[field]["codes"]]
+        return np.flatnonzero(mask)
+
+class BatchWriter:
+    # Appends DataFrame batches to one CSV or Parquet file; Parquet needs pyarrow and writes one row group per batch
+    def __init__(self, sPath, sFormat="csv"):
+        self.sPath = sPath
+        self.sFormat = sFormat
+        self.xParquetWriter = None
+        self.bHeaderWritten = False
+
+    def write(self, df):
+        if self.sFormat == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self.xParquetWriter is None:
+                self.xParquetWriter = pq.ParquetWriter(self.sPath, table.schema)
+            self.xParquetWriter.write_table(table.cast(self.xParquetWriter.schema))
+        else:
+            df.to_csv(self.sPath, mode='a' if self.bHeaderWritten else 'w', header=not self.bHeaderWritten, index=False)
+            self.bHeaderWritten = True
+
+    def close(self):
+        if self.xParquetWriter is not None:
+            self.xParquetWriter.close()
+            self.xParquetWriter = None
+
+class ChangeEventSink:
+    # Streams classified changes as newline-delimited JSON to a file, a named pipe ("\\\\.\\pipe\\name" or a FIFO),
+    # "unix:/path/to/socket" or "tcp:127.0.0.1:port". Events are queued by the monitor and written in batches by a
+    # background thread. While the reader is slow or away the thread keeps its batch and reconnects with backoff; once
+    # the bounded queue is full, emit() waits up to fBlockSeconds and then drops events, counting them.
+    def __init__(self, sTarget, nQueueEvents=10000, nBatchEvents=500, fFlushSeconds=0.2, fBlockSeconds=0.0):
+        self.sTarget = sTarget
+        self.nBatchEvents = nBatchEvents
+        self.fFlushSeconds = fFlushSeconds
+        self.fBlockSeconds = fBlockSeconds
+        self.xQueue = queue.Queue(maxsize=nQueueEvents)
+        self.xStats = {"nSent": 0, "nDropped": 0, "nReconnects": 0}
+        self.xStatsLock = threading.Lock()  # nDropped is counted by both the caller and the writer thread
+        self.xConnection = None
+        self.sLastError = ''
+        self.xStopEvent = threading.Event()
+        self.xThread = threading.Thread(target=self.run, name="ChangeEventSink", daemon=True)
+        self.xThread.start()
+
+    def emit(self, xLines):
+        # One fBlockSeconds deadline for the whole call; once it has passed, lines that find the queue full are dropped
+        fDeadline = time.monotonic() + self.fBlockSeconds
+        nDropped = 0
+        for sLine in xLines:
+            fWait = fDeadline - time.monotonic()
+            try:
+                if fWait > 0:
+                    self.xQueue.put(sLine, timeout=fWait)
+                else:
+                    self.xQueue.put_nowait(sLine)
+            except queue.Full:
+                nDropped += 1
+        if nDropped:
+            with self.xStatsLock:
+                self.xStats["nDropped"] += nDropped
+
+    def connect(self):
+        if self.sTarget.startswith("unix:"):
+            xSocket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            xSocket.settimeout(5)
+            try:
+                xSocket.connect(self.sTarget[5:])
+            except OSError:
+                xSocket.close()
+                raise
+            return xSocket
+        if self.sTarget.startswith("tcp:"):
+            sHost, _, sPort = self.sTarget[4:].rpartition(':')
+            xSocket = socket.create_connection((sHost or "127.0.0.1", int(sPort)), timeout=5)
+            return xSocket
+        if os.name == "posix" and os.path.exists(self.sTarget) and S_ISFIFO(os.stat(self.sTarget).st_mode):
+            # Opening a FIFO without a reader would block; O_NONBLOCK fails with ENXIO instead and is retried later
+            fd = os.open(self.sTarget, os.O_WRONLY | os.O_NONBLOCK)
+            os.set_blocking(fd, True)
+            return os.fdopen(fd, 'wb')
+        return open(self.sTarget, 'ab')
+
+    def write(self, xData):
+        if self.xConnection is None:
+            self.xConnection = self.connect()
+        if isinstance(self.xConnection, socket.socket):
+            self.xConnection.sendall(xData)
+        else:
+            self.xConnection.write(xData)
+            self.xConnection.flush()
+
+    def disconnect(self):
+        if self.xConnection is not None:
+            try:
+                self.xConnection.close()
+            except OSError:
+                pass
+            self.xConnection = None
+
+    def run(self):
+        xBatch = []
+        fBackoff = 0.0
+        while True:
+            if not xBatch:
+                try:
+                    xBatch.append(self.xQueue.get(timeout=self.fFlushSeconds))
+                except queue.Empty:
+                    if self.xStopEvent.is_set():
+                        break
+                    continue
+                # Gather whatever else is queued, up to a batch, into one write
+                while len(xBatch) < self.nBatchEvents:
+                    try:
+                        xBatch.append(self.xQueue.get_nowait())
+                    except queue.Empty:
+                        break
+            try:
+                self.write(''.join(xBatch).encode('utf-8'))
+                self.xStats["nSent"] += len(xBatch)
+                xBatch = []
+                fBackoff = 0.0
+            except OSError as e:
+                # Reader gone or not there yet: keep the batch, reconnect later; a broken pipe may have cut the last line
+                if str(e) != self.sLastError:
+                    xLogger.warning("Event sink %s unavailable: %s", self.sTarget, e)
+                    self.sLastError = str(e)
+                self.disconnect()
+                self.xStats["nReconnects"] += 1
+                fBackoff = min(5.0, fBackoff * 2 or 0.1)
+                if self.xStopEvent.wait(fBackoff) and fBackoff >= 5.0:
+                    # Closing and the reader has stayed away; what is left is dropped
+                    while True:
+                        try:
+                            xBatch.append(self.xQueue.get_nowait())
+                        except queue.Empty:
+                            break
+                    with self.xStatsLock:
+                        self.xStats["nDropped"] += len(xBatch)
+                    break
+        self.disconnect()
+
+    def close(self, fTimeout=10.0):
+        # Flush what is queued, then stop the writer thread; False if it is still writing after fTimeout
+        self.xStopEvent.set()
+        self.xThread.join(fTimeout)
+        if self.xThread.is_alive():
+            # Closing the connection now would cut its current write; the thread disconnects when it finishes
+            return False
+        self.disconnect()
+        return True
+
+    def getSummary(self):
+        return f"{self.xStats['nSent']} events sent, {self.xStats['nDropped']} dropped, {self.xQueue.qsize()} queued"
+
+# Subtree parse workers map the hive file read-only, so all workers share its pages instead of each reading a copy
+xPartitionHive = None
+
+def openMappedRoot(xMap):
+    # The root key's cell offset is stored at 0x24 in the REGF header; +4 skips the cell size and +2 the "nk" signature
+    root_offset = struct.unpack_from('<I', xMap, 0x24)[0]
+    importRegipy()
+    return NKRecord(Cell(cell_type="nk", offset=REGF_HEADER_SIZE + root_offset + 6, size=0), xMap)
+
+def initPartitionWorker(sHivePath):
+    global xPartitionHive
+    with open(sHivePath, 'rb') as f:
+        xMap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    xPartitionHive = (PARSNIPMonitor(), openMappedRoot(xMap))
+
+def parseHiveSubtree(sKeyPath, xIndexPath):
+    # The subtree root is found by child position rather than name, so duplicate key names cannot mislead it
+    monitor, nk_record = xPartitionHive
+    for i in xIndexPath:
+        nk_record = next(itertools.islice(nk_record.iter_subkeys(), i, None))
+    piece = RegistrySnapshot()
+    key_index = {}
+    monitor.parseHiveKeys(piece, itertools.chain(monitor.walkHive(nk_record, sKeyPath), [(sKeyPath, nk_record)]), key_index)
+    piece.xStrings = None
+    return piece, key_index
+
+class PARSNIPMonitor:
+    # Parsing, change detection, classification and export, without any Tk dependency.
+    # Notifications go to the log; the GUI subclass overrides showMessage/reportProgress to surface them.
+    def __init__(self):
+        self.xPreviousData = None   # Previous snapshot (RegistrySnapshot)
+        self.xKeyIndex = None       # (snapshot, per-key fingerprints and key ids) from the previous parse
+        self.xHiveFingerprint = None  # (hive path, header fingerprint) of the hive xPreviousData was parsed from
+        self.bIncrementalParse = True
         self.sPreviousHiveType = None
         self.sHivePath = ''
         self.nEntryLimit = 100
         self.nInterval = 300
-        self.selected_features = None
         self.sRandomForestPath = ''
+        self.xModelCache = None     # ((path, mtime, size), model, feature columns)
+        self.xFeatureScalers = None # ((path, mtime, size), {"minmax": ..., "robust": ...})
+        self.bFitSharedScalers = True  # Fit and save missing model scalers from the first snapshot; hive workers leave it to the parent
+        self.nScalerSampleRows = 200000  # Rows per hive a worker hands to the parent for fitting the scalers
+        self.xScalerFeatures = None  # That sample, until it is returned with the cycle result
+        self.xScoreCache = OrderedDict()  # Feature-vector hash -> malicious probability, least recently used first
+        self.nScoreCacheSize = 100000
+        self.nInferenceBatchRows = 10000  # Rows scored per predict_proba call, bounding memory on bulk changes
+        self.nInferenceJobs = None  # n_jobs for the model's predict_proba; None keeps the model's own setting
+        self.xInferenceStats = {"nRows": 0, "nCacheHits": 0, "nScored": 0, "fInferenceSeconds": 0.0}
+        self.sRulesPath = ''  # Optional JSON file of allow/deny rules, checked before the built-in ones
+        self.bDefaultRules = True
+        self.xChangeRules = None  # ((path, mtime, size, defaults), compiled rules)
+        self.xRuleStats = {}  # Rule name -> changes it decided without the model
         self.sClassifiedCsvPath = ''
-        self.allData = []  # Current snapshot data
-        self.setupUI()
+        self.sClassifiedStoreDir = ''  # Optional day-partitioned Parquet store for classified changes
+        self.sEventSinkTarget = ''  # Optional NDJSON stream of classified changes: file, named pipe, unix:PATH or tcp:HOST:PORT
+        self.nEventQueue = 10000  # Events buffered while the reader is slow or away
+        self.fEventBlockSeconds = 0.0  # How long a full event queue may hold up the cycle before events are dropped
+        self.xEventSink = None
+        self.sOutputDir = sScriptPath  # Where snapshot, preprocessed and classified CSVs are written
+        self.nParseWorkers = os.cpu_count() or 1  # Processes for full parses of large hives, capped at the cores and subtrees; 1 parses serially
+        self.nSplitDepth = 1  # Depth of the subtrees handed to parse workers (1 = top-level keys)
+        self.nPartitionedParseBytes = 16 * 2**20  # Smaller hives are parsed serially
+        self.sBaselineDir = ''  # Optional versioned baseline store, so diffing resumes after a restart
+        self.nBaselineKeep = 100  # Baseline versions kept per hive; 0 keeps all
+        self.sDeltaDir = ''  # Delta export store: one compressed full snapshot, then only each tick's changes
+        self.nDeltaRebase = 1000  # Deltas written before the next full snapshot starts a new chain; 0 never rebases
+        self.xDeltaChain = None  # (hive delta dir, deltas written since its last full snapshot)
+        self.sExportFormat = "csv"  # Snapshot and preprocessed exports: "csv" or "parquet"
+        self.nExportBatchRows = 50000
+        self.xCancelEvent = threading.Event()
+        self.xCycleMetrics = []  # Stages of the current refresh cycle: name, rows, seconds, memory
+        self.sMetricsPath = ''  # Rolling JSON-lines file of per-cycle stage metrics; empty disables it
+        self.nMetricsFileBytes = 8 * 2**20  # The metrics file is rotated to <path>.1 beyond this size
+        self.bProfileNextCycle = False  # Dump a cProfile and tracemalloc report for the next cycle into sOutputDir
 
     # Implicit expected columns (defined via a method)
     def get_expected_columns(self):
@@ -74,37 +737,17 @@ class PARSNIP:
         return df
 
     def categorizePath(self, p):
-        if "Run" in p:
-            return "Startup Path"
-        elif "Services" in p:
-            return "Service Path"
-        elif "Internet Settings" in p:
-            return "Network Path"
+        for cat, needle in xPathCategoryRules:
+            if needle in p:
+                return cat
         return "Other Path"
 
     def mapType(self, t):
-        type_map = {
-            "String": ["REG_SZ", "REG_EXPAND_SZ", "REG_MULTI_SZ"],
-            "Numeric": ["REG_DWORD", "REG_QWORD"],
-            "Binary": ["REG_BINARY"],
-            "Others": ["REG_NONE", "REG_LINK", "0"]
-        }
-        for group, vals in type_map.items():
-            if t in vals:
-                return group
-        return "Others"
+        return xTypeGroups.get(t, "Others")
 
     def categorizeKeyName(self, kn):
-        categories = {
-            "Run Keys": ["Run", "RunOnce", "RunServices"],
-            "Service Keys": ["ImageFileExecutionOptions", "AppInit_DLLs"],
-            "Security and Configuration Keys": ["Policies", "Explorer"],
-            "Internet and Network Keys": ["ProxyEnable", "ProxyServer"],
-            "File Execution Keys": ["ShellExecuteHooks"]
-        }
-        low = kn.lower()
-        for cat, keys in categories.items():
-            if any(k.lower() in low for k in keys):
+        for cat, pattern in xKeyNameCategoryRules:
+            if pattern.search(kn):
                 return cat
         return "Other Keys"
 
@@ -113,52 +756,1260 @@ class PARSNIP:
             return len(v)
         return v
 
-    def preprocessData(self, df):
+    # Vectorized category labelling; each rule set is evaluated once per distinct string, not once per row
+    def categorizeColumn(self, values, rules, sDefault):
+        codes, uniques = pd.factorize(values, use_na_sentinel=False)
+        uniques = pd.Series(uniques, dtype=object).astype(str)
+        labels = np.full(len(uniques), sDefault, dtype=object)
+        # Apply rules last-to-first so the first matching rule wins
+        for cat, pattern in reversed(rules):
+            labels[uniques.str.contains(pattern, regex=not isinstance(pattern, str)).to_numpy(dtype=bool)] = cat
+        return labels[codes]
+
+    # Feature scaling artifact: fitted once on a baseline snapshot and saved next to the RandomForest file
+    def getScalerPath(self):
+        if not self.sRandomForestPath:
+            return ''
+        return os.path.splitext(self.sRandomForestPath)[0] + "_scalers.joblib"
+
+    def loadFeatureScalers(self):
+        path = self.getScalerPath()
+        if path and os.path.exists(path):
+            stat = os.stat(path)
+            cache_key = (path, stat.st_mtime_ns, stat.st_size)
+            if self.xFeatureScalers is None or self.xFeatureScalers[0] != cache_key:
+                self.xFeatureScalers = (cache_key, joblib.load(path))
+            return self.xFeatureScalers[1]
+        # Scalers fitted this session but not (yet) saved for the current model path
+        if self.xFeatureScalers is not None and self.xFeatureScalers[0][0] == path:
+            return self.xFeatureScalers[1]
+        return None
+
+    def fitFeatureScalers(self, xOut):
+        from sklearn.preprocessing import MinMaxScaler, RobustScaler
+        scalers = {
+            "minmax": MinMaxScaler().fit(xOut[xMinMaxColumns]),
+            "robust": RobustScaler().fit(xOut[xRobustColumns])
+        }
+        # A column with no values at all fits NaN parameters, which would turn that feature into NaN everywhere
+        params = [scalers["minmax"].data_min_, scalers["minmax"].data_max_, scalers["robust"].center_, scalers["robust"].scale_]
+        if any(np.isnan(values).any() for values in params):
+            raise ValueError("Feature scalers fitted NaN parameters; a scaled column has no values")
+        path = self.getScalerPath()
+        cache_key = (path, 0, 0)
+        if path:
+            try:
+                # Written under a temporary name and renamed, so hive workers fitting at once never leave a torn file
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                joblib.dump(scalers, tmp_path)
+                os.replace(tmp_path, path)
+                stat = os.stat(path)
+                cache_key = (path, stat.st_mtime_ns, stat.st_size)
+            except OSError as e:
+                self.showMessage("error", "Error", f"Could not save feature scalers to {path}: {e}")
+        self.xFeatureScalers = (cache_key, scalers)
+        return scalers
+
+    def processValueColumn(self, values):
+        if pd.api.types.is_numeric_dtype(values):
+            return values
+        # String lengths; non-string values pass through unchanged as in preprocessValue
+        return pd.to_numeric(values.str.len().fillna(values), errors='coerce')
+
+    def snapshotScalerFeatures(self, snapshot):
+        # Only the scaled numeric columns, for fitting scalers on a whole baseline without preprocessing every row
+        features = {col: snapshot.column(col) for col in ['Depth', 'Key Size', 'Subkey Count', 'Value Count']}
+        features['Value Processed'] = self.processValueColumn(pd.Series(snapshot.xValues, dtype=object))
+        return pd.DataFrame(features)
+
+    def preprocessData(self, df, bFitScalers=False):
+        expected = self.get_expected_columns()
+        if df.empty:
+            return pd.DataFrame(columns=expected)
+        numeric_df = df.select_dtypes(include=[np.number])
+        xDf = df.fillna(numeric_df.mean())
+        nRows = len(xDf)
+        features = {}
+        for col in ['Key', 'Depth', 'Key Size', 'Subkey Count', 'Value Count', 'Label', 'Tactic']:
+            features[col] = xDf[col] if col in xDf.columns else np.zeros(nRows, dtype=np.int64)
+
+        # One-hot columns for Path, Type, and Key Name, emitted directly in the expected layout
+        path_labels = self.categorizeColumn(xDf['Key'], xPathCategoryRules, "Other Path")
+        for cat in ["Network Path", "Other Path", "Service Path", "Startup Path"]:
+            features[f"PathCategory_{cat}"] = path_labels == cat
+        codes, uniques = pd.factorize(xDf['Type'], use_na_sentinel=False)
+        type_labels = pd.Series(uniques, dtype=object).map(xTypeGroups).fillna("Others").to_numpy()[codes]
+        for group in ["Binary", "Numeric", "Others", "String"]:
+            features[f"TypeGroup_{group}"] = type_labels == group
+        name_labels = self.categorizeColumn(xDf['Name'], xKeyNameCategoryRules, "Other Keys")
+        for cat in ["Other Keys", "Run Keys", "Security and Configuration Keys", "Service Keys", "Internet and Network Keys"]:
+            features[f"KeyNameCategory_{cat}"] = name_labels == cat
+
+        features['Value Processed'] = self.processValueColumn(xDf['Value'])
+        for col in ['Name', 'Value', 'Type']:
+            features[col] = xDf[col]
+        xOut = pd.DataFrame(features, index=xDf.index)[expected]
+
+        # Scale numeric columns with the baseline scalers; a batch is only fitted against itself when no baseline exists
+        scalers = self.loadFeatureScalers()
+        if scalers is None and bFitScalers:
+            scalers = self.fitFeatureScalers(xOut)
+        if scalers is not None:
+            xOut[xMinMaxColumns] = scalers["minmax"].transform(xOut[xMinMaxColumns])
+            xOut[xRobustColumns] = scalers["robust"].transform(xOut[xRobustColumns])
+        else:
+            from sklearn.preprocessing import MinMaxScaler, RobustScaler
+            xOut[xMinMaxColumns] = MinMaxScaler().fit_transform(xOut[xMinMaxColumns])
+            xOut[xRobustColumns] = RobustScaler().fit_transform(xOut[xRobustColumns])
+        return xOut
+
+    def preprocessAndExport(self, snapshot, settings=None):
+        if not len(snapshot):
+            return
+        if self.loadFeatureScalers() is None:
+            if not self.bFitSharedScalers and self.getScalerPath():
+                # Hive worker: the parent fits one set of scalers for the model from every hive's rows and saves it;
+                # until then this hive hands over a sample of its rows and exports nothing preprocessed
+                features = self.snapshotScalerFeatures(snapshot)
+                if len(features) > self.nScalerSampleRows:
+                    features = features.sample(self.nScalerSampleRows, random_state=0)
+                self.xScalerFeatures = features
+                return
+            # The baseline scalers see every row, even though only the first nEntryLimit rows are exported
+            self.fitFeatureScalers(self.snapshotScalerFeatures(snapshot))
+        if (settings or self.getCycleSettings())["sDeltaDir"]:
+            # Delta exports replace the capped per-tick dumps; the changes are preprocessed when they are classified
+            return
+        self.exportBatches((self.preprocessData(batch) for batch in self.iterSnapshotBatches(snapshot)), "preprocessed")
+
+    # Registry parsing
+    def walkHive(self, nk_record, path_root=None):
+        # Post-order walk matching RegistryHive.recurse_subkeys, yielding (path, NKRecord) without reading any values
+        if nk_record.header.subkey_count:
+            for subkey in nk_record.iter_subkeys():
+                subkey_path = rf"{path_root}\{subkey.name}" if path_root else f"\\{subkey.name}"
+                if subkey.subkey_count:
+                    yield from self.walkHive(subkey, subkey_path)
+                yield subkey_path, subkey
+        if path_root is None:
+            yield "\\", nk_record
+
+    def readKeyValues(self, nk_record):
+        if not nk_record.values_count:
+            return []
+        try:
+            return list(nk_record.iter_values())
+        except RegistryParsingException:
+            return []
+
+    def keyFingerprint(self, subkey, scount):
+        # A key's last-write time moves whenever its values or direct subkey list change
+        header = subkey.header
+        return (header.last_modified, header.values_count, header.largest_value_name, header.largest_value_data, scount)
+
+    def readKeyInto(self, snapshot, kpath, subkey, scount):
+        # Append a key and its values; keys without values are not stored and get id -1
+        values = self.readKeyValues(subkey)
+        if not values:
+            return -1
+        kid = snapshot.addKey(kpath, kpath.count('\\'), len(kpath.encode('utf-8')), scount, len(values))
+        for val in values:
+            snapshot.addValue(
+                kid,
+                str(val.name) if val.name else "0",
+                str(val.value) if val.value else "0",
+                str(val.value_type) if val.value_type else "0"
+            )
+        return kid
+
+    def parseHiveKeys(self, snapshot, xKeys, key_index, previous_snapshot=None, previous_index=None):
+        # xKeys yields (path, NKRecord) in walkHive order, so every key's subkeys are counted before the key itself
+        subkey_counts = {}
+        for nKeys, (kpath, subkey) in enumerate(xKeys, 1):
+            if nKeys % 5000 == 0:
+                self.reportProgress(f"Parsing hive... {nKeys} keys, {len(snapshot.xNames)} values")
+            parent_path = '\\'.join(kpath.split('\\')[:-1])
+            subkey_counts[parent_path] = subkey_counts.get(parent_path, 0) + 1
+            scount = subkey_counts.get(kpath, 0)
+            fingerprint = self.keyFingerprint(subkey, scount)
+            cached = previous_index.get(kpath) if previous_index else None
+            if cached is not None and cached[0] == fingerprint:
+                kid = snapshot.copyKey(previous_snapshot, cached[1]) if cached[1] >= 0 else -1
+            else:
+                kid = self.readKeyInto(snapshot, kpath, subkey, scount)
+            key_index[kpath] = (fingerprint, kid)
+
+    # Partitioned parsing: keys above nSplitDepth are read here, the subtrees below it by a process pool
+    def planHivePartitions(self, nk_record, path_root=None, xIndexPath=()):
+        # Yields walkHive-ordered ("key", path, NKRecord, subkey count) and ("subtree", path, child index path) items
+        nSubkeys = 0
+        if nk_record.header.subkey_count:
+            for i, subkey in enumerate(nk_record.iter_subkeys()):
+                nSubkeys += 1
+                subkey_path = rf"{path_root}\{subkey.name}" if path_root else f"\\{subkey.name}"
+                if len(xIndexPath) + 1 >= self.nSplitDepth:
+                    yield ("subtree", subkey_path, xIndexPath + (i,))
+                else:
+                    yield from self.planHivePartitions(subkey, subkey_path, xIndexPath + (i,))
+        # The root's subkeys are counted under "" by parseHiveKeys, so the root itself reports 0
+        yield ("key", path_root or "\\", nk_record, nSubkeys if path_root else 0)
+
+    def parseHivePartitioned(self, hive_path, snapshot, key_index, nWorkers):
+        # Returns False, having parsed nothing, when there are too few subtrees to share out
+        with open(hive_path, 'rb') as f:
+            xMap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        pool = None
+        try:
+            plan = list(self.planHivePartitions(openMappedRoot(xMap)))
+            subtrees = [item for item in plan if item[0] == "subtree"]
+            nWorkers = min(nWorkers, len(subtrees))
+            if nWorkers < 2:
+                return False
+            pool = ProcessPoolExecutor(max_workers=nWorkers, initializer=initPartitionWorker, initargs=(hive_path,))
+            futures = {item[2]: pool.submit(parseHiveSubtree, item[1], item[2]) for item in subtrees}
+            nDone = 0
+            # Results are merged in plan order, so the snapshot is identical to a serial parse
+            for item in plan:
+                if item[0] == "key":
+                    kpath, subkey, scount = item[1:]
+                    key_index[kpath] = (self.keyFingerprint(subkey, scount), self.readKeyInto(snapshot, kpath, subkey, scount))
+                    continue
+                piece, piece_index = futures[item[2]].result()
+                offset = snapshot.extend(piece)
+                for kpath, (fingerprint, kid) in piece_index.items():
+                    key_index[kpath] = (fingerprint, kid + offset if kid >= 0 else -1)
+                nDone += 1
+                self.reportProgress(f"Parsing hive... {nDone}/{len(subtrees)} subtrees, {len(snapshot.xNames)} values")
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+            xMap.close()
+        return True
+
+    def parseRegistry(self, hive_path, settings=None):
+        snapshot = RegistrySnapshot()
+        # Per-key index from the previous pass: path -> (fingerprint, key id in that pass's snapshot or -1)
+        previous_snapshot, previous_index = self.xKeyIndex if self.bIncrementalParse and self.xKeyIndex else (None, {})
+        key_index = {}
+        importRegipy()
+        try:
+            with self.measureStage("parseRegistry") as stage:
+                # Incremental passes only re-read changed keys and stay serial; full parses of large hives are partitioned
+                # when there is more than one core to run the workers on
+                nWorkers = min(self.nParseWorkers, os.cpu_count() or 1)
+                bPartitioned = False
+                if not previous_index and nWorkers > 1 and os.path.getsize(hive_path) >= self.nPartitionedParseBytes:
+                    bPartitioned = self.parseHivePartitioned(hive_path, snapshot, key_index, nWorkers)
+                if not bPartitioned:
+                    hive = RegistryHive(hive_path)
+                    self.parseHiveKeys(snapshot, self.walkHive(hive.root), key_index, previous_snapshot, previous_index)
+                self.xKeyIndex = (snapshot.finalize(), key_index)
+                stage["rows"] = len(snapshot)
+            with self.measureStage("preprocessAndExport", min(len(snapshot), self.nEntryLimit)):
+                self.preprocessAndExport(snapshot, settings)
+        except RefreshCancelled:
+            raise
+        except Exception as e:
+            self.xKeyIndex = None
+            self.showMessage("error", "Error", f"Error parsing hive: {e}")
+        return snapshot.finalize()
+
+    # Model loading
+    def loadModel(self):
+        # Cached per (path, mtime, size) so the forest is only deserialized again when the file changes.
+        stat = os.stat(self.sRandomForestPath)
+        cache_key = (self.sRandomForestPath, stat.st_mtime_ns, stat.st_size)
+        if self.xModelCache is None or self.xModelCache[0] != cache_key:
+            model = joblib.load(self.sRandomForestPath)
+            selected = list(model.feature_names_in_) if hasattr(model, "feature_names_in_") else None
+            self.xModelCache = (cache_key, model, selected)
+            # Cached scores belong to the previous model
+            self.xScoreCache.clear()
+        return self.xModelCache[1], self.xModelCache[2]
+
+    def featureMatrix(self, X):
+        # Model input as used for both training and inference: every feature numeric, unparseable values 0
+        return X.apply(lambda col: pd.to_numeric(col, errors='coerce').fillna(0))
+
+    # Malicious probability per feature row. Rows seen before (values flipping back and forth, MRU lists)
+    # reuse their cached score; the rest are scored once per distinct row, in bounded batches.
+    def scoreFeatures(self, model, X):
+        hashes = pd.util.hash_pandas_object(X, index=False).to_numpy()
+        unique_hashes, first_rows, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+        keys = unique_hashes.tolist()
+        cached = [self.xScoreCache.get(value) for value in keys]
+        misses = np.array([pos for pos, score in enumerate(cached) if score is None], dtype=np.intp)
+        unique_scores = np.array([np.nan if score is None else score for score in cached])
+        for pos in np.flatnonzero(~np.isnan(unique_scores)).tolist():
+            self.xScoreCache.move_to_end(keys[pos])
+        if len(misses):
+            if self.nInferenceJobs is not None and hasattr(model, "n_jobs"):
+                model.n_jobs = self.nInferenceJobs
+            start = time.perf_counter()
+            for nStart in range(0, len(misses), self.nInferenceBatchRows):
+                batch = misses[nStart:nStart + self.nInferenceBatchRows]
+                unique_scores[batch] = model.predict_proba(X.iloc[first_rows[batch]])[:, 1]
+            self.xInferenceStats["fInferenceSeconds"] += time.perf_counter() - start
+            self.xScoreCache.update(zip(unique_hashes[misses].tolist(), unique_scores[misses].tolist()))
+        while len(self.xScoreCache) > self.nScoreCacheSize:
+            self.xScoreCache.popitem(last=False)
+        self.xInferenceStats["nRows"] += len(X)
+        self.xInferenceStats["nCacheHits"] += len(X) - len(misses)
+        self.xInferenceStats["nScored"] += len(misses)
+        return unique_scores[inverse.ravel()]
+
+    def getInferenceSummary(self):
+        stats = self.xInferenceStats
+        fHitRate = stats["nCacheHits"] / stats["nRows"] if stats["nRows"] else 0.0
+        fLatency = stats["fInferenceSeconds"] * 1000 / stats["nScored"] if stats["nScored"] else 0.0
+        return f"score cache hit rate {fHitRate:.1%} ({len(self.xScoreCache)} cached), inference {fLatency:.3f} ms/row over {stats['nScored']} rows"
+
+    # Allow/deny prefilter: changes matching a rule are labelled without the model
+    def compileChangeRules(self, entries):
+        xCategories = {cat for cat, _ in xPathCategoryRules} | {cat for cat, _ in xKeyNameCategoryRules} | {"Other Path", "Other Keys"}
+        rules = []
+        for sAction, sRule, sKey, sName, sPathCategory, sNameCategory in entries:
+            if sAction not in ("allow", "deny"):
+                raise ValueError(f"Rule {sRule!r}: action must be 'allow' or 'deny', not {sAction!r}")
+            if not any([sKey, sName, sPathCategory, sNameCategory]):
+                raise ValueError(f"Rule {sRule!r} matches nothing: give a key, name, path_category or name_category")
+            for sCategory in (sPathCategory, sNameCategory):
+                if sCategory and sCategory not in xCategories:
+                    raise ValueError(f"Rule {sRule!r}: unknown category {sCategory!r}")
+            try:
+                rules.append((sAction, sRule, re.compile(sKey, re.IGNORECASE) if sKey else None,
+                              re.compile(sName, re.IGNORECASE) if sName else None, sPathCategory, sNameCategory))
+            except re.error as e:
+                raise ValueError(f"Rule {sRule!r}: bad pattern: {e}")
+        return rules
+
+    def readRulesFile(self, path):
+        # JSON list of {"action", "rule", "key", "name", "path_category", "name_category"} objects
+        with open(path, encoding='utf-8') as f:
+            entries = json.load(f)
+        if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+            raise ValueError(f"{path} must hold a JSON list of rule objects")
+        return [(entry.get("action"), entry.get("rule") or f"{path}#{pos + 1}", entry.get("key"), entry.get("name"),
+                 entry.get("path_category"), entry.get("name_category")) for pos, entry in enumerate(entries)]
+
+    def getChangeRules(self):
+        # Recompiled only when the rules file or the defaults switch changes
+        cache_key = (self.sRulesPath, self.bDefaultRules)
+        if self.sRulesPath:
+            stat = os.stat(self.sRulesPath)
+            cache_key += (stat.st_mtime_ns, stat.st_size)
+        if self.xChangeRules is None or self.xChangeRules[0] != cache_key:
+            entries = self.readRulesFile(self.sRulesPath) if self.sRulesPath else []
+            if self.bDefaultRules:
+                entries += xDefaultChangeRules
+            self.xChangeRules = (cache_key, self.compileChangeRules(entries))
+        return self.xChangeRules[1]
+
+    def searchColumn(self, values, pattern):
+        # Patterns with capture groups are searched value by value; pandas would warn that str.contains ignores them
+        if pattern.groups:
+            return np.array([pattern.search(value) is not None for value in values.tolist()], dtype=bool)
+        return values.str.contains(pattern).to_numpy(dtype=bool)
+
+    def matchChangeRules(self, df):
+        # Index of the first matching rule per row, -1 where the model decides
+        rules = self.getChangeRules()
+        matched = np.full(len(df), -1, dtype=np.intp)
+        if not rules or df.empty:
+            return rules, matched
+        key_codes, key_uniques = pd.factorize(df['Key'], use_na_sentinel=False)
+        name_codes, name_uniques = pd.factorize(df['Name'], use_na_sentinel=False)
+        key_uniques = pd.Series(key_uniques, dtype=object).astype(str)
+        name_uniques = pd.Series(name_uniques, dtype=object).astype(str)
+        path_labels = name_labels = None
+        if any(rule[4] for rule in rules):
+            path_labels = self.categorizeColumn(key_uniques, xPathCategoryRules, "Other Path")
+        if any(rule[5] for rule in rules):
+            name_labels = self.categorizeColumn(name_uniques, xKeyNameCategoryRules, "Other Keys")
+        # Apply rules last-to-first so the first matching rule wins
+        for pos in range(len(rules) - 1, -1, -1):
+            _, _, key_re, name_re, sPathCategory, sNameCategory = rules[pos]
+            key_hits = np.ones(len(key_uniques), dtype=bool)
+            name_hits = np.ones(len(name_uniques), dtype=bool)
+            if key_re is not None:
+                key_hits &= self.searchColumn(key_uniques, key_re)
+            if sPathCategory:
+                key_hits &= path_labels == sPathCategory
+            if name_re is not None:
+                name_hits &= self.searchColumn(name_uniques, name_re)
+            if sNameCategory:
+                name_hits &= name_labels == sNameCategory
+            matched[key_hits[key_codes] & name_hits[name_codes]] = pos
+        return rules, matched
+
+    def getRuleSummary(self):
+        nDecided = sum(self.xRuleStats.values())
+        if not nDecided:
+            return "no changes decided by rules"
+        hits = ", ".join(f"{sRule} {nHits}" for sRule, nHits in sorted(self.xRuleStats.items(), key=lambda item: -item[1]))
+        return f"{nDecided} changes decided by rules ({hits})"
+
+    # Classification of changes
+    def classifyChanges(self, changes_df):
+        if changes_df.empty:
+            return changes_df
+
+        actions = changes_df["Action"] if "Action" in changes_df.columns else None
+        # Rule decisions first; only the rows no rule matched are preprocessed and go to the model.
+        # Rule-decided rows keep their raw Key, Name, Value and Type with empty feature columns.
+        rules, matched = self.matchChangeRules(changes_df)
+        undecided = matched < 0
+        if undecided.all():
+            df_unified = self.preprocessData(changes_df)
+        else:
+            ruled = changes_df.loc[~undecided, ['Key', 'Name', 'Value', 'Type']].reindex(columns=self.get_expected_columns())
+            df_unified = pd.concat([self.preprocessData(changes_df[undecided]), ruled]) if undecided.any() else ruled
+            order = np.concatenate([np.flatnonzero(undecided), np.flatnonzero(~undecided)])
+            df_unified = df_unified.iloc[np.argsort(order, kind='stable')]
+
+        # Add the preserved "Action" column back into the unified DataFrame for refernece
+        if actions is not None:
+            df_unified["Action"] = actions.values
+
+        labels = np.full(len(df_unified), "Unclassified", dtype=object)
+        scores = np.full(len(df_unified), np.nan)
+        decided_by = np.full(len(df_unified), "Model", dtype=object)
+        for pos in np.unique(matched[matched >= 0]).tolist():
+            sAction, sRule = rules[pos][:2]
+            rows = matched == pos
+            labels[rows] = "Benign" if sAction == "allow" else "Malicious"
+            decided_by[rows] = f"Rule: {sRule}"
+            self.xRuleStats[sRule] = self.xRuleStats.get(sRule, 0) + int(rows.sum())
+        if not undecided.any():
+            xLogger.debug("Classified %d rows; %s", len(df_unified), self.getRuleSummary())
+        elif not self.sRandomForestPath or not os.path.exists(self.sRandomForestPath):
+            self.showMessage("error", "Error", "Random Forest model file not set or not found.")
+            decided_by[undecided] = ""
+        else:
+            model, selected = self.loadModel()
+            if selected is not None:
+                try:
+                    X = df_unified.loc[undecided, selected].copy()
+                except KeyError:
+                    self.showMessage("error", "Error", "Some expected feature columns are missing in the input data.")
+                    X = None
+                    decided_by[undecided] = ""
+            else:
+                X = df_unified.loc[undecided].drop(columns=xNonFeatureColumns, errors='ignore')
+            if X is not None:
+                X = self.featureMatrix(X)
+                y_scores = self.scoreFeatures(model, X)
+                xLogger.debug("Classified %d rows; %s; %s", len(df_unified), self.getInferenceSummary(), self.getRuleSummary())
+                labels[undecided] = np.where(y_scores >= 0.5, 'Malicious', 'Benign')
+                scores[undecided] = y_scores
+        df_unified.loc[:, 'Predicted Label'] = labels
+        df_unified.loc[:, 'Score'] = scores
+        df_unified.loc[:, 'Decided By'] = decided_by
+        df_unified.loc[:, 'Change Detected Datetime'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return df_unified
+
+    # Model training
+    def getFeatureColumns(self):
+        return [col for col in self.get_expected_columns() if col not in xNonFeatureColumns]
+
+    def readTrainingCsv(self, path, sLabelColumn):
+        # Labeled snapshot, change or classified CSV -> raw rows (xRowColumns) plus a 0/1 "Label"
+        df = pd.read_csv(path, dtype={col: str for col in ['Key', 'Name', 'Value', 'Type']}, low_memory=False)
+        missing = [col for col in ['Key', 'Name', 'Value', 'Type', sLabelColumn] if col not in df.columns]
+        if missing:
+            raise ValueError(f"{path} has no {', '.join(missing)} column")
+        df = df[df[sLabelColumn].notna()]
+        rows = pd.DataFrame({col: df[col].fillna('') for col in ['Key', 'Name', 'Value', 'Type']})
+        if 'Value Processed' in df.columns:
+            # Classified CSVs hold scaled numbers: depth and size are recomputed from the key path, the counts
+            # are left missing and imputed by trainModel
+            rows['Depth'] = rows['Key'].str.count(r'\\')
+            rows['Key Size'] = rows['Key'].str.encode('utf-8').str.len()
+            rows['Subkey Count'] = np.nan
+            rows['Value Count'] = np.nan
+        else:
+            for col in ['Depth', 'Key Size', 'Subkey Count', 'Value Count']:
+                rows[col] = pd.to_numeric(df[col], errors='coerce') if col in df.columns else np.nan
+        labels = df[sLabelColumn].astype(str).str.strip().str.lower()
+        rows['Label'] = labels.isin(["1", "1.0", "true", "malicious"]).astype(np.int64)
+        return rows[xRowColumns + ['Label']]
+
+    def trainModel(self, xCsvPaths, sModelPath, sLabelColumn="Label", nFolds=5, nJobs=-1, nRfeFeatures=0, fTestSize=0.2):
+        from sklearn.base import clone
+        from sklearn.ensemble import RandomForestClassifier
+        from sklearn.feature_selection import RFE
+        from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, roc_auc_score
+        from sklearn.model_selection import train_test_split, GridSearchCV, StratifiedKFold
+        from sklearn.pipeline import Pipeline
+
+        data = pd.concat([self.readTrainingCsv(path, sLabelColumn) for path in xCsvPaths], ignore_index=True)
+        y = data.pop('Label').to_numpy()
+        # Counts missing from classified CSVs take the mean of the snapshot/change CSVs in the set, or 0 without any;
+        # preprocessData's batch-mean imputation has nothing to work with for an all-missing column
+        for col in ['Depth', 'Key Size', 'Subkey Count', 'Value Count']:
+            fMean = data[col].mean()
+            data[col] = data[col].fillna(0 if pd.isna(fMean) else fMean)
+        if np.bincount(y, minlength=2).min() < nFolds:
+            raise ValueError(f"Training needs at least {nFolds} malicious and {nFolds} benign rows")
+
+        # Features come from the same preprocessData as inference. Its scalers are fitted on the training rows and
+        # kept in memory (no model path yet) until they are saved next to the model.
+        self.reportProgress(f"Preprocessing {len(data)} training rows...")
+        self.sRandomForestPath = ''
+        self.xFeatureScalers = None
+        X = self.featureMatrix(self.preprocessData(data, bFitScalers=True)[self.getFeatureColumns()])
+        scalers = self.xFeatureScalers[1]
+
+        steps = [("rf", RandomForestClassifier(random_state=0))]
+        if 0 < nRfeFeatures < X.shape[1]:
+            steps.insert(0, ("rfe", RFE(RandomForestClassifier(n_estimators=50, random_state=0), n_features_to_select=nRfeFeatures)))
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=fTestSize, stratify=y, random_state=0)
+        with tempfile.TemporaryDirectory() as sCacheDir:
+            # Pipeline memory caches the fitted RFE per fold, so every grid point reuses the same fold features;
+            # pandas output keeps column names, so the forest's feature_names_in_ are the selected feature columns
+            pipeline = Pipeline(steps, memory=sCacheDir).set_output(transform="pandas")
+            search = GridSearchCV(
+                pipeline,
+                {f"rf__{name}": values for name, values in xTrainingGrid.items()},
+                scoring="roc_auc",
+                cv=StratifiedKFold(n_splits=nFolds, shuffle=True, random_state=0),
+                n_jobs=nJobs,
+                refit=False
+            )
+            nSettings = len(list(itertools.product(*xTrainingGrid.values())))
+            self.reportProgress(f"Grid search over {nSettings} settings, {nFolds} folds...")
+            search.fit(X_train, y_train)
+            best = clone(pipeline).set_params(**search.best_params_)
+
+            # Held-out evaluation, then the saved model is refitted on every labeled row
+            scores = best.fit(X_train, y_train).predict_proba(X_test)[:, 1]
+            predicted = (scores >= 0.5).astype(np.int64)
+            metrics = {
+                "accuracy": accuracy_score(y_test, predicted),
+                "precision": precision_score(y_test, predicted, zero_division=0),
+                "recall": recall_score(y_test, predicted, zero_division=0),
+                "f1": f1_score(y_test, predicted, zero_division=0),
+                "roc_auc": roc_auc_score(y_test, scores),
+                "cv_roc_auc": search.best_score_
+            }
+            self.reportProgress("Fitting the final model...")
+            model = best.fit(X, y).named_steps["rf"]
+        selected = list(model.feature_names_in_)
+        if not set(selected) <= set(self.getFeatureColumns()):
+            raise ValueError(f"Trained features {selected} do not match the preprocessed columns")
+
+        # Scalers first, so a monitor that picks up the new model file always finds its matching scalers
+        self.sRandomForestPath = sModelPath
+        for path, obj in ((self.getScalerPath(), scalers), (sModelPath, model)):
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            joblib.dump(obj, tmp_path)
+            os.replace(tmp_path, path)
+        report = {
+            "rows": len(y),
+            "malicious": int(y.sum()),
+            "features": selected,
+            "params": {name.split("__", 1)[1]: value for name, value in search.best_params_.items()},
+            "metrics": metrics
+        }
+        with open(os.path.splitext(sModelPath)[0] + "_metrics.json", 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        self.xModelCache = None
+        self.xFeatureScalers = None
+        self.xScoreCache.clear()
+        return report
+
+    def appendClassifiedCsv(self, df, sHivePath=None):
         if df.empty:
-            return pd.DataFrame()
-        xDf = df.copy()
-        numeric_df = xDf.select_dtypes(include=[np.number])
-        xDf.fillna(numeric_df.mean(), inplace=True)
-
-        # Create one-hot encoded columns for Path, Type, and Key Name
-        xDf['Path Category'] = xDf['Key'].apply(self.categorizePath)
-        path_dummies = pd.get_dummies(xDf['Path Category'], prefix='PathCategory')
-        xDf = pd.concat([xDf, path_dummies], axis=1)
-
-        xDf['Type Group'] = xDf['Type'].apply(self.mapType)
-        type_dummies = pd.get_dummies(xDf['Type Group'], prefix='TypeGroup')
-        xDf = pd.concat([xDf, type_dummies], axis=1)
-
-        xDf['Key Name Category'] = xDf['Name'].apply(self.categorizeKeyName)
-        name_dummies = pd.get_dummies(xDf['Key Name Category'], prefix='KeyNameCategory')
-        xDf = pd.concat([xDf, name_dummies], axis=1)
-
-        xDf['Value Processed'] = xDf['Value'].apply(self.preprocessValue)
-
-        # Scale numeric columns
-        scaler_minmax = MinMaxScaler()
-        for col in ['Depth', 'Value Count', 'Value Processed']:
-            if col in xDf.columns:
-                xDf[[col]] = scaler_minmax.fit_transform(xDf[[col]])
-        scaler_robust = RobustScaler()
-        for col in ['Key Size', 'Subkey Count']:
-            if col in xDf.columns:
-                xDf[[col]] = scaler_robust.fit_transform(xDf[[col]])
-
-        return xDf
-
-    def preprocessAndExport(self, xData):
-        if not xData:
             return
-        xDf = pd.DataFrame(xData)
-        preproc = self.preprocessData(xDf)
-        preproc = self.unifyFinalColumns(preproc)
+        if self.sClassifiedStoreDir:
+            self.appendClassifiedStore(df)
+        if self.sEventSinkTarget:
+            self.emitChangeEvents(df, sHivePath)
+        if self.sClassifiedCsvPath and os.path.exists(self.sClassifiedCsvPath):
+            # Only the header is read; new rows are appended without rewriting the history
+            with open(self.sClassifiedCsvPath, newline='', encoding='utf-8') as f:
+                header = next(csv.reader(f), None)
+            if header is None:
+                df.to_csv(self.sClassifiedCsvPath, index=False)
+            elif sorted(header) == sorted(df.columns):
+                df[header].to_csv(self.sClassifiedCsvPath, mode='a', header=False, index=False)
+            else:
+                self.showMessage("error", "Error", f"Column layout of {self.sClassifiedCsvPath} does not match the classified changes; starting a new CSV.")
+                self.createClassifiedCsv(df)
+        else:
+            self.createClassifiedCsv(df)
+
+    # Change events: one JSON object per classified change, streamed to sEventSinkTarget
+    def getEventSink(self):
+        if self.xEventSink is not None and self.xEventSink.sTarget != self.sEventSinkTarget:
+            self.closeEventSink()
+        if self.xEventSink is None:
+            self.xEventSink = ChangeEventSink(self.sEventSinkTarget, self.nEventQueue, fBlockSeconds=self.fEventBlockSeconds)
+        return self.xEventSink
+
+    def emitChangeEvents(self, df, sHivePath=None):
+        columns = {"Change Detected Datetime": "time", "Hive": "hive", "Action": "action", "Key": "key", "Name": "name", "Value": "value",
+                   "Type": "type", "Predicted Label": "label", "Score": "score", "Decided By": "decided_by"}
+        events = df[[col for col in columns if col in df.columns]].rename(columns=columns)
+        if "hive" not in events.columns:
+            events.insert(1, "hive", sHivePath or self.sHivePath)
+        if "time" in events.columns:
+            events["time"] = events["time"].astype(str).str.replace(' ', 'T', n=1)
+        # Missing values (unscored rows) become null rather than NaN, which is not valid JSON
+        events = events.astype(object).where(events.notna(), None)
+        self.getEventSink().emit(json.dumps(event, default=str) + "\n" for event in events.to_dict('records'))
+
+    def closeEventSink(self):
+        if self.xEventSink is not None:
+            if self.xEventSink.close():
+                xLogger.info("Event sink %s: %s", self.xEventSink.sTarget, self.xEventSink.getSummary())
+            else:
+                xLogger.warning("Event sink %s still writing after close; provisional counts: %s", self.xEventSink.sTarget, self.xEventSink.getSummary())
+            self.xEventSink = None
+
+    def createClassifiedCsv(self, df):
+        new_csv = self.getOutputPath("classified_changes")
+        df.to_csv(new_csv, index=False)
+        self.sClassifiedCsvPath = new_csv
+        self.reportCsvPath(new_csv)
+        self.showMessage("info", "CSV Created", f"Classified CSV created at: {new_csv}")
+
+    # Columnar store: one partition directory per day, one Parquet part per refresh, so nothing is ever rewritten
+    def appendClassifiedStore(self, df):
+        now = datetime.now()
+        partition = os.path.join(self.sClassifiedStoreDir, f"day={now.strftime('%Y-%m-%d')}")
+        os.makedirs(partition, exist_ok=True)
+        part = df.copy()
+        for col in part.select_dtypes(include=['object']).columns:
+            part[col] = part[col].astype(str)
+        try:
+            part.to_parquet(os.path.join(partition, f"part_{now.strftime('%H%M%S_%f')}.parquet"), index=False)
+        except ImportError as e:
+            self.showMessage("error", "Error", f"Parquet store needs pyarrow: {e}")
+            self.sClassifiedStoreDir = ''
+
+    def readClassifiedStore(self, sStartDay=None, sEndDay=None):
+        # Days are YYYY-MM-DD strings; only the partitions in range are opened
+        frames = []
+        if os.path.isdir(self.sClassifiedStoreDir):
+            for name in sorted(os.listdir(self.sClassifiedStoreDir)):
+                day = name.partition('=')[2]
+                if not name.startswith('day=') or (sStartDay and day < sStartDay) or (sEndDay and day > sEndDay):
+                    continue
+                frames.append(pd.read_parquet(os.path.join(self.sClassifiedStoreDir, name)))
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    # Change detection: compare previous and current snapshot
+    def indexSnapshot(self, snapshot):
+        # Index rows by the (Key, Name, Type) composite key; positions are stored last-to-first so pop() yields the earliest
+        index = {}
+        keys, names, types = snapshot.column("Key").tolist(), snapshot.xNames.tolist(), snapshot.xTypes.tolist()
+        for pos in range(len(keys) - 1, -1, -1):
+            index.setdefault((keys[pos], names[pos], types[pos]), []).append(pos)
+        return index
+
+    def checkChanges(self, previous, current):
+        prev_index = self.indexSnapshot(previous)
+        matched = bytearray(len(previous))
+        prev_hashes = previous.rowHashes().tolist()
+        curr_hashes = current.rowHashes().tolist()
+        changed = []
+        actions = []
+
+        # Look up each current entry in the previous snapshot by its composite key
+        composite = zip(current.column("Key").tolist(), current.xNames.tolist(), current.xTypes.tolist())
+        for curr_pos, ck in enumerate(composite):
+            positions = prev_index.get(ck)
+            if positions:
+                # Consume the earliest unmatched previous entry so duplicates pair up in order
+                pos = positions.pop()
+                matched[pos] = 1
+                # If the content hash differs, mark as modified
+                if curr_hashes[curr_pos] != prev_hashes[pos]:
+                    changed.append(curr_pos)
+                    actions.append('Modified')
+            else:
+                # No matching previous entry found means this entry was added
+                changed.append(curr_pos)
+                actions.append('Added')
+
+        # Any previous entries left unmatched were removed
+        removed = [pos for pos in range(len(previous)) if not matched[pos]]
+        if not changed and not removed:
+            return pd.DataFrame()
+        frames = []
+        if changed:
+            frames.append(current.toFrame(np.array(changed, dtype=np.int64)).assign(Action=actions))
+        if removed:
+            frames.append(previous.toFrame(np.array(removed, dtype=np.int64)).assign(Action='Removed'))
+        return pd.concat(frames, ignore_index=True)
+
+    def getOutputPath(self, sPrefix, sFormat="csv"):
+        # Timestamped output path; batch runs and parallel hive workers can finish several cycles within a second,
+        # so the name is claimed by creating the file exclusively and never reused
         ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        out_csv = os.path.join(sScriptPath, f"preprocessed_{ts}.csv")
-        if len(preproc) > self.nEntryLimit:
-            preproc = preproc.head(self.nEntryLimit)
-        preproc.to_csv(out_csv, index=False)
-        
+        nSuffix = 0
+        while True:
+            path = os.path.join(self.sOutputDir, f"{sPrefix}_{ts}_{nSuffix}.{sFormat}" if nSuffix else f"{sPrefix}_{ts}.{sFormat}")
+            try:
+                with open(path, 'x'):
+                    return path
+            except FileExistsError:
+                nSuffix += 1
+
+    # Notifications: logged here, shown as dialogs by the GUI
+    def showMessage(self, sKind, sTitle, sMessage):
+        xLogger.log(logging.ERROR if sKind == "error" else logging.WARNING if sKind == "warning" else logging.INFO, "%s: %s", sTitle, sMessage)
+
+    def reportProgress(self, sText):
+        if self.xCancelEvent.is_set():
+            raise RefreshCancelled()
+        xLogger.debug(sText)
+
+    def reportCsvPath(self, sPath):
+        pass
+
+    # Cheap change check that reads no more than the hive header: the regf sequence numbers and last-written
+    # timestamp, plus size and mtime of the hive and its transaction logs (live hives log writes to .LOG1/.LOG2
+    # first and may refuse to be opened). None when the hive does not exist.
+    def readHiveFingerprint(self, path):
+        parts = []
+        for sPath in (path, path + '.LOG', path + '.LOG1', path + '.LOG2'):
+            try:
+                st = os.stat(sPath)
+                parts.append((st.st_size, st.st_mtime_ns))
+            except OSError:
+                parts.append(None)
+        if parts[0] is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(20)
+            if header[:4] == b'regf':
+                parts.append(struct.unpack_from('<IIQ', header, 4))
+        except OSError:
+            pass
+        return tuple(parts)
+
+    # Per-stage metrics: wall time, rows handled and memory of each step of a refresh cycle
+    @contextlib.contextmanager
+    def measureStage(self, sStage, nRows=None):
+        stage = {"stage": sStage, "rows": nRows}
+        resetPeakMemory()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage["seconds"] = round(time.perf_counter() - start, 4)
+            nRss, nPeak = readProcessMemory()
+            stage["rss_mb"] = None if nRss is None else round(nRss / 2**20, 1)
+            stage["peak_rss_mb"] = None if nPeak is None else round(nPeak / 2**20, 1)
+            if tracemalloc.is_tracing():
+                stage["traced_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+            self.xCycleMetrics.append(stage)
+
+    def formatCycleMetrics(self, stages):
+        # One status line: total time and the slowest stages first
+        parts = []
+        for stage in sorted(stages, key=lambda stage: -stage["seconds"])[:4]:
+            rows = "" if stage["rows"] is None else f", {stage['rows']:,} rows"
+            peak = "" if stage["peak_rss_mb"] is None else f", {stage['peak_rss_mb']:.0f} MiB peak"
+            parts.append(f"{stage['stage']} {stage['seconds']:.2f}s{rows}{peak}")
+        return f"Last cycle {sum(stage['seconds'] for stage in stages):.2f}s: " + " | ".join(parts)
+
+    def recordCycleMetrics(self, sHivePath, stages):
+        if not self.sMetricsPath or not stages:
+            return
+        line = json.dumps({"time": datetime.now().isoformat(timespec="seconds"), "hive": sHivePath, "pid": os.getpid(), "stages": stages})
+        try:
+            if os.path.exists(self.sMetricsPath) and os.path.getsize(self.sMetricsPath) >= self.nMetricsFileBytes:
+                os.replace(self.sMetricsPath, self.sMetricsPath + ".1")
+            with open(self.sMetricsPath, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+        except OSError as e:
+            xLogger.warning("Could not write metrics to %s: %s", self.sMetricsPath, e)
+
+    def profileCycle(self, fnCycle):
+        # Opt-in deep profile of one cycle: a cProfile stats file and the top tracemalloc allocation sites
+        # Deferred imports are loaded first; under tracemalloc they would dominate both reports
+        from sklearn.preprocessing import MinMaxScaler, RobustScaler
+        importRegipy()
+        importLazyModules()
+        profiler = cProfile.Profile()
+        tracemalloc.start(10)
+        profiler.enable()
+        try:
+            return fnCycle()
+        finally:
+            profiler.disable()
+            allocations = tracemalloc.take_snapshot().statistics('lineno')
+            tracemalloc.stop()
+            path = self.getOutputPath("profile", "prof")
+            profiler.dump_stats(path)
+            with open(os.path.splitext(path)[0] + "_memory.txt", 'w', encoding='utf-8') as f:
+                for stat in allocations[:50]:
+                    f.write(f"{stat}\n")
+            self.showMessage("info", "Profile Saved", f"Cycle profile written to: {path}")
+
+    # One monitoring cycle: parse the hive, detect changes against the previous snapshot, classify and export
+    def runMonitorCycle(self, bClassify=True):
+        self.xCycleMetrics = []
+        if self.bProfileNextCycle:
+            self.bProfileNextCycle = False
+            result = self.profileCycle(lambda: self.runMonitorStages(bClassify))
+        else:
+            result = self.runMonitorStages(bClassify)
+        result["metrics"] = self.xCycleMetrics
+        return result
+
+    # Hive path and store settings for one cycle; the GUI can change the attributes while the worker thread runs it
+    def getCycleSettings(self):
+        return {
+            "sHivePath": self.sHivePath,
+            "sBaselineDir": self.sBaselineDir,
+            "nBaselineKeep": self.nBaselineKeep,
+            "sDeltaDir": self.sDeltaDir,
+            "nDeltaRebase": self.nDeltaRebase,
+            "sExportFormat": self.sExportFormat
+        }
+
+    def runMonitorStages(self, bClassify):
+        result = {"bHiveChanged": False, "bUnchanged": False, "current": None, "changes": None, "classified": None}
+        settings = self.getCycleSettings()
+        sHivePath = settings["sHivePath"]
+        # Skip the export, parse and diff while the hive is as it was when the baseline was parsed
+        with self.measureStage("checkHive"):
+            fingerprint = self.readHiveFingerprint(sHivePath)
+        if fingerprint is not None and self.xPreviousData is not None and self.xHiveFingerprint == (sHivePath, fingerprint):
+            self.reportProgress("Hive unchanged")
+            result["bUnchanged"] = True
+            result["current"] = self.xPreviousData
+            return result
+        # Cleared until the cycle completes, so a cancelled or failed cycle is never mistaken for an unchanged hive
+        self.xHiveFingerprint = None
+        if self.isLiveHive(sHivePath):
+            self.reportProgress("Exporting live hive...")
+            with self.measureStage("exportRegistry"):
+                parsed_path = self.exportRegistry(sHivePath)
+        else:
+            parsed_path = sHivePath
+
+        if os.path.exists(parsed_path):
+            # Get the base hive name and normalize it by removing trailing " (number)"
+            base_hive = os.path.basename(parsed_path).split('.')[0].lower()
+            hive_type = re.sub(r'\s*\(\d+\)$', '', base_hive)
+            if hive_type != self.sPreviousHiveType:
+                result["bHiveChanged"] = True
+                self.xPreviousData = None
+                if settings["sBaselineDir"]:
+                    with self.measureStage("loadBaseline"):
+                        self.xPreviousData = self.loadBaseline(hive_type, settings)
+                self.xKeyIndex = None
+                self.xDeltaChain = None
+                self.sPreviousHiveType = hive_type
+
+            self.reportProgress("Parsing hive...")
+            current_data = self.parseRegistry(parsed_path, settings)
+            result["current"] = current_data
+
+            bBaselineChanged = self.xPreviousData is None
+            changes = None
+            if self.xPreviousData is not None:
+                self.reportProgress(f"Comparing {len(current_data)} values...")
+                with self.measureStage("checkChanges", len(current_data)):
+                    changes = self.checkChanges(self.xPreviousData, current_data)
+                bBaselineChanged = not changes.empty
+                if not changes.empty:
+                    result["changes"] = changes
+                if not changes.empty and bClassify:
+                    self.reportProgress(f"Classifying {len(changes)} changes...")
+                    with self.measureStage("classifyChanges", len(changes)):
+                        classified = self.classifyChanges(changes)
+                    with self.measureStage("appendClassifiedCsv", len(classified)):
+                        self.appendClassifiedCsv(classified, sHivePath)
+                    result["classified"] = classified
+            self.xPreviousData = current_data
+            if settings["sDeltaDir"]:
+                self.reportProgress("Exporting delta...")
+                with self.measureStage("exportDelta", len(current_data) if changes is None else len(changes)):
+                    self.exportDelta(current_data, changes, hive_type, settings)
+            else:
+                self.reportProgress("Exporting snapshot...")
+                with self.measureStage("exportSnapshot", min(len(current_data), self.nEntryLimit)):
+                    self.exportToCSV(current_data, 'snapshot')
+            # A failed parse clears xKeyIndex; its partial snapshot must not become the stored baseline
+            if settings["sBaselineDir"] and bBaselineChanged and self.xKeyIndex is not None:
+                self.reportProgress("Saving baseline...")
+                with self.measureStage("saveBaseline", len(current_data)):
+                    self.saveBaseline(current_data, hive_type, settings)
+            # Taken before the export, so a write that lands during the parse shows up as a change next tick
+            if self.xKeyIndex is not None and fingerprint is not None:
+                self.xHiveFingerprint = (sHivePath, fingerprint)
+        return result
+
+    # Baseline store: one directory per monitored hive, one snapshot file per version; names sort oldest first
+    def getHiveStoreName(self, hive_type, sHivePath):
+        # Hives of one type in different folders (e.g. each user's NTUSER.DAT) keep separate baselines and deltas
+        source_dir = os.path.dirname(os.path.abspath(sHivePath)).lower()
+        return f"{hive_type}_{hashlib.sha1(source_dir.encode('utf-8')).hexdigest()[:8]}"
+
+    def getBaselineDir(self, hive_type, settings):
+        return os.path.join(settings["sBaselineDir"], self.getHiveStoreName(hive_type, settings["sHivePath"]))
+
+    def listBaselines(self, hive_type, settings):
+        path = self.getBaselineDir(hive_type, settings)
+        if not os.path.isdir(path):
+            return []
+        return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(sBaselineSuffix))
+
+    def loadBaseline(self, hive_type, settings):
+        versions = self.listBaselines(hive_type, settings)
+        if not versions:
+            return None
+        try:
+            snapshot = RegistrySnapshot.load(versions[-1])
+        except (OSError, ValueError, KeyError) as e:
+            self.showMessage("error", "Error", f"Could not load baseline {versions[-1]}: {e}")
+            return None
+        self.showMessage("info", "Baseline Loaded", f"Resuming from baseline: {versions[-1]}")
+        return snapshot
+
+    def saveBaseline(self, snapshot, hive_type, settings):
+        path = self.getBaselineDir(hive_type, settings)
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        try:
+            os.makedirs(path, exist_ok=True)
+            snapshot.save(os.path.join(path, f"{ts}{sBaselineSuffix}"), {"hive": settings["sHivePath"], "hive_type": hive_type, "created": ts})
+        except OSError as e:
+            self.showMessage("error", "Error", f"Could not save baseline to {path}: {e}")
+            return
+        if settings["nBaselineKeep"] > 0:
+            for old in self.listBaselines(hive_type, settings)[:-settings["nBaselineKeep"]]:
+                try:
+                    os.remove(old)
+                except OSError:
+                    # Still memory-mapped (Windows) or already gone; retried after the next save
+                    pass
+
+    # Delta store: per hive, a chain of one full snapshot (base_<ts>) followed by the change sets of the ticks after it
+    # (delta_<ts>, with their Action). Unchanged ticks write nothing. Files are gzipped CSV or Parquet per sExportFormat.
+    def getDeltaDir(self, hive_type, settings):
+        return os.path.join(settings["sDeltaDir"], self.getHiveStoreName(hive_type, settings["sHivePath"]))
+
+    def writeDeltaFile(self, sDir, sKind, batches, sExportFormat):
+        sName = f"{sKind}_{datetime.now().strftime(sStoreTimestamp)}.{'parquet' if sExportFormat == 'parquet' else 'csv.gz'}"
+        # Written under a temporary name (keeping the extension, which selects the compression) and renamed when complete
+        tmp_path = os.path.join(sDir, f"tmp{os.getpid()}_{sName}")
+        writer = BatchWriter(tmp_path, sExportFormat)
+        try:
+            for batch in batches:
+                writer.write(batch)
+        finally:
+            writer.close()
+        os.replace(tmp_path, os.path.join(sDir, sName))
+        return os.path.join(sDir, sName)
+
+    def exportDelta(self, snapshot, changes, hive_type, settings):
+        # changes is None when there was no previous snapshot to diff against
+        if self.xKeyIndex is None:
+            # A failed parse leaves a partial snapshot; the next tick starts a new chain from a complete one
+            self.xDeltaChain = None
+            return
+        sDir = self.getDeltaDir(hive_type, settings)
+        nRebase = settings["nDeltaRebase"]
+        try:
+            os.makedirs(sDir, exist_ok=True)
+            if changes is None or self.xDeltaChain is None or self.xDeltaChain[0] != sDir or (nRebase and self.xDeltaChain[1] >= nRebase):
+                batches = (batch[xSnapshotColumns] for batch in self.iterSnapshotBatches(snapshot, nLimit=len(snapshot)))
+                path = self.writeDeltaFile(sDir, "base", batches, settings["sExportFormat"])
+                self.xDeltaChain = (sDir, 0)
+                self.showMessage("info", "Export Complete", f"Full snapshot exported to: {path}")
+            elif not changes.empty:
+                path = self.writeDeltaFile(sDir, "delta", [changes[xSnapshotColumns + ["Action"]]], settings["sExportFormat"])
+                self.xDeltaChain = (sDir, self.xDeltaChain[1] + 1)
+                xLogger.debug("%d changes exported to %s", len(changes), path)
+        except OSError as e:
+            self.xDeltaChain = None
+            self.showMessage("error", "Error", f"Could not write delta export to {sDir}: {e}")
+
+    def listDeltaFiles(self, sDir):
+        # (timestamp, "base" or "delta", path), oldest first
+        files = []
+        for name in os.listdir(sDir):
+            match = xDeltaFilePattern.match(name)
+            if match:
+                files.append((match.group(2), match.group(1), os.path.join(sDir, name)))
+        return sorted(files)
+
+    def readDeltaFile(self, path):
+        if path.endswith(".parquet"):
+            return pd.read_parquet(path)
+        return pd.read_csv(path, dtype={col: str for col in ["Key", "Name", "Value", "Type", "Action"]}, keep_default_na=False)
+
+    def reconstructSnapshot(self, sDir, at=None):
+        # Snapshot of the hive as of `at` (a datetime; None = latest): the last full snapshot taken by then, with
+        # every later delta up to `at` applied. Per (Key, Name, Type) only the last event counts.
+        sAt = at.strftime(sStoreTimestamp) if at is not None else None
+        files = [item for item in self.listDeltaFiles(sDir) if sAt is None or item[0] <= sAt]
+        bases = [pos for pos, item in enumerate(files) if item[1] == "base"]
+        if not bases:
+            raise ValueError(f"No full snapshot in {sDir}" + (f" taken by {at}" if at is not None else ""))
+        base = self.readDeltaFile(files[bases[-1]][2])
+        deltas = [self.readDeltaFile(path) for _, sKind, path in files[bases[-1] + 1:] if sKind == "delta"]
+        if deltas:
+            events = pd.concat(deltas, ignore_index=True).drop_duplicates(subset=["Key", "Name", "Type"], keep='last')
+            touched = pd.MultiIndex.from_frame(base[["Key", "Name", "Type"]]).isin(pd.MultiIndex.from_frame(events[["Key", "Name", "Type"]]))
+            base = pd.concat([base[~touched], events[events["Action"] != "Removed"].drop(columns="Action")], ignore_index=True)
+        return RegistrySnapshot.fromFrame(base)
+
+    # Refresh groups of hives; each group holds the paths of one hive in the order they are diffed
+    def runHiveCycles(self, xHiveGroups):
+        results = []
+        frames = []
+        for paths in xHiveGroups.values():
+            for path in paths:
+                self.sHivePath = path
+                try:
+                    result = self.runMonitorCycle()
+                    current = result.pop("current")
+                    result["nValues"] = None if current is None else len(current)
+                except RefreshCancelled:
+                    raise
+                except Exception as e:
+                    result = {"error": str(e)}
+                result["sHivePath"] = path
+                self.recordCycleMetrics(path, result.get("metrics"))
+                if result.get("classified") is not None:
+                    frames.append(result["classified"])
+                results.append(result)
+        return results, pd.concat(frames, ignore_index=True) if frames else None
+
+    # Export helpers: rows are materialized, transformed and written in fixed-size batches, up to the entry limit
+    def iterSnapshotBatches(self, snapshot, positions=None, nLimit=None):
+        if positions is None:
+            positions = np.arange(len(snapshot))
+        nRows = min(len(positions), max(self.nEntryLimit if nLimit is None else nLimit, 0))
+        for start in range(0, nRows, self.nExportBatchRows):
+            yield snapshot.toFrame(positions[start:min(nRows, start + self.nExportBatchRows)])
+
+    def exportBatches(self, batches, prefix):
+        # Batches are pulled one at a time, so nothing past the current batch is built or held
+        writer = None
+        try:
+            for batch in batches:
+                if writer is None:
+                    writer = BatchWriter(self.getOutputPath(prefix, self.sExportFormat), self.sExportFormat)
+                writer.write(batch)
+        finally:
+            if writer is not None:
+                writer.close()
+        return writer.sPath if writer is not None else None
+
+    def exportToCSV(self, snapshot, prefix):
+        columns = ["Key", "Name", "Value", "Type", "Subkey Count", "Value Count", "Key Size", "Depth"]
+        out_path = self.exportBatches((batch[columns] for batch in self.iterSnapshotBatches(snapshot)), prefix)
+        if out_path:
+            self.showMessage("info", "Export Complete", f"Data exported to: {out_path}")
+
+    # Registry Export (Live Hive)
+    def exportRegistry(self, hive_path):
+        hive_type = os.path.basename(hive_path).split('.')[0].lower()
+        hive_ext = os.path.splitext(hive_path)[1]
+        if hive_type == 'ntuser':
+            hive_param = 'HKCU'
+            self.sExportPath = os.path.join(self.sOutputDir, os.path.basename(hive_path))
+        elif hive_type == 'system':
+            hive_param = 'HKLM\\System'
+            self.sExportPath = os.path.join(self.sOutputDir, os.path.basename(hive_path) + hive_ext)
+        elif hive_type == 'software':
+            hive_param = 'HKLM\\Software'
+            self.sExportPath = os.path.join(self.sOutputDir, os.path.basename(hive_path) + hive_ext)
+        elif hive_type == 'sam':
+            hive_param = 'HKLM\\SAM'
+            self.sExportPath = os.path.join(self.sOutputDir, os.path.basename(hive_path) + hive_ext)
+        elif hive_type == 'security':
+            hive_param = 'HKLM\\SECURITY'
+            self.sExportPath = os.path.join(self.sOutputDir, os.path.basename(hive_path) + hive_ext)
+        elif hive_type == 'hardware':
+            hive_param = 'HKLM\\HARDWARE'
+            self.sExportPath = os.path.join(self.sOutputDir, os.path.basename(hive_path) + hive_ext)
+        else:
+            hive_param = 'HKLM'
+            self.sExportPath = os.path.join(self.sOutputDir, os.path.basename(hive_path) + hive_ext)
+        try:
+            subprocess.check_call(['reg', 'save', hive_param, self.sExportPath, '/y'])
+            self.showMessage("info", "Success", f"Unparsed Registry exported to: {self.sExportPath}")
+        except subprocess.CalledProcessError as e:
+            self.showMessage("error", "Error", f"Error exporting registry: {e}")
+        return self.sExportPath
+
+    def isLiveHive(self, path):
+        low = path.lower()
+        return ('system32' in low) or (low == sNtuserPath.lower())
+
+# Multi-hive monitoring: every hive gets its own worker process, which keeps that hive's baseline snapshot and
+# incremental-parse index in memory between cycles, so only the change sets cross the process boundary.
+# With a single core the same per-hive monitors run in this process, one hive after another
+xWorkerMonitor = None
+
+def newHiveMonitor(xSettings):
+    monitor = PARSNIPMonitor()
+    for sName, value in xSettings.items():
+        setattr(monitor, sName, value)
+    return monitor
+
+def initHiveWorker(xSettings, xLogConfig):
+    global xWorkerMonitor
+    if xLogConfig:
+        logging.basicConfig(**xLogConfig)
+    xWorkerMonitor = newHiveMonitor(xSettings)
+
+def runHiveWorkerCycles(xHivePaths, monitor=None):
+    # Parse and diff only; the parent classifies the merged changes of all hives in one batch
+    monitor = monitor or xWorkerMonitor
+    results = []
+    for path in xHivePaths:
+        monitor.sHivePath = path
+        try:
+            result = monitor.runMonitorCycle(bClassify=False)
+            current = result.pop("current")
+            result["nValues"] = None if current is None else len(current)
+            result["scalerFeatures"] = monitor.xScalerFeatures
+        except Exception as e:
+            result = {"error": str(e)}
+        monitor.xScalerFeatures = None
+        result["sHivePath"] = path
+        results.append(result)
+    return results
+
+class MultiHiveMonitor(PARSNIPMonitor):
+    # Refreshes all hive groups at once, so a cycle takes as long as the slowest hive rather than the sum,
+    # and merges their changes into one classified stream written by this process
+    def __init__(self, xLogConfig=None):
+        super().__init__()
+        self.xLogConfig = xLogConfig or {}
+        self.xHiveWorkers = {}  # Hive group -> single-process executor holding that hive's baseline
+        self.xHiveMonitors = {}  # Hive group -> in-process monitor, used instead when there is a single core
+
+    def getHiveWorkerSettings(self, nHives):
+        return {
+            "sOutputDir": self.sOutputDir,
+            "nEntryLimit": self.nEntryLimit,
+            "bIncrementalParse": self.bIncrementalParse,
+            "sRandomForestPath": self.sRandomForestPath,
+            # Workers share the model's scaler file, so only this process fits and writes it
+            "bFitSharedScalers": False,
+            "nScalerSampleRows": self.nScalerSampleRows,
+            # Hives already run in parallel, so each one's subtree parsing gets a share of the cores
+            "nParseWorkers": max(1, self.nParseWorkers // nHives),
+            "nSplitDepth": self.nSplitDepth,
+            "nPartitionedParseBytes": self.nPartitionedParseBytes,
+            "sBaselineDir": self.sBaselineDir,
+            "nBaselineKeep": self.nBaselineKeep,
+            "sDeltaDir": self.sDeltaDir,
+            "nDeltaRebase": self.nDeltaRebase,
+            "sExportFormat": self.sExportFormat,
+            "bProfileNextCycle": self.bProfileNextCycle
+        }
+
+    def getHiveWorker(self, sHiveKey, nHives):
+        if sHiveKey not in self.xHiveWorkers:
+            settings = self.getHiveWorkerSettings(nHives)
+            self.xHiveWorkers[sHiveKey] = ProcessPoolExecutor(max_workers=1, initializer=initHiveWorker, initargs=(settings, self.xLogConfig))
+        return self.xHiveWorkers[sHiveKey]
+
+    def runHiveGroupsInWorkers(self, xHiveGroups):
+        futures = {key: self.getHiveWorker(key, len(xHiveGroups)).submit(runHiveWorkerCycles, paths) for key, paths in xHiveGroups.items()}
+        wait(futures.values())
+        xHiveResults = {}
+        for key, future in futures.items():
+            try:
+                xHiveResults[key] = future.result()
+            except BrokenProcessPool as e:
+                # The worker died with its baseline; the next cycle starts this hive over
+                self.xHiveWorkers.pop(key).shutdown(wait=False)
+                xHiveResults[key] = [{"sHivePath": path, "error": f"Worker process failed: {e}"} for path in xHiveGroups[key]]
+        return xHiveResults
+
+    def runHiveGroupsInProcess(self, xHiveGroups):
+        xHiveResults = {}
+        for key, paths in xHiveGroups.items():
+            if key not in self.xHiveMonitors:
+                self.xHiveMonitors[key] = newHiveMonitor(self.getHiveWorkerSettings(len(xHiveGroups)))
+            xHiveResults[key] = runHiveWorkerCycles(paths, self.xHiveMonitors[key])
+        return xHiveResults
+
+    def runHiveCycles(self, xHiveGroups):
+        self.xCycleMetrics = []
+        self.reportProgress(f"Refreshing {len(xHiveGroups)} hives...")
+        if min(os.cpu_count() or 1, len(xHiveGroups)) > 1:
+            xHiveResults = self.runHiveGroupsInWorkers(xHiveGroups)
+        else:
+            # One core or one hive: worker processes would only add their start-up and pickling cost
+            xHiveResults = self.runHiveGroupsInProcess(xHiveGroups)
+        results = []
+        frames = []
+        scaler_frames = []
+        for key, hive_results in xHiveResults.items():
+            for result in hive_results:
+                # Stage metrics are written here rather than by the workers, so one process owns the metrics file
+                self.recordCycleMetrics(result["sHivePath"], result.get("metrics"))
+                features = result.pop("scalerFeatures", None)
+                if features is not None:
+                    scaler_frames.append(features)
+                if result.get("changes") is not None:
+                    frames.append(result["changes"].assign(Hive=result["sHivePath"]))
+                results.append(result)
+        if scaler_frames and self.loadFeatureScalers() is None:
+            # The model has no scalers yet: fit one set on the rows of all hives, before any changes are classified
+            with self.measureStage("fitFeatureScalers", sum(len(frame) for frame in scaler_frames)):
+                try:
+                    self.fitFeatureScalers(pd.concat(scaler_frames, ignore_index=True))
+                except ValueError as e:
+                    self.showMessage("error", "Error", str(e))
+        if not frames:
+            return results, None
+        changes = pd.concat(frames, ignore_index=True)
+        hives = changes.pop("Hive").to_numpy()
+        self.reportProgress(f"Classifying {len(changes)} changes...")
+        with self.measureStage("classifyChanges", len(changes)):
+            classified = self.classifyChanges(changes)
+        classified.insert(0, "Hive", hives)
+        with self.measureStage("appendClassifiedCsv", len(classified)):
+            self.appendClassifiedCsv(classified)
+        self.recordCycleMetrics("(merged changes)", self.xCycleMetrics)
+        return results, classified
+
+    def shutdown(self):
+        for worker in self.xHiveWorkers.values():
+            worker.shutdown(wait=True, cancel_futures=True)
+        self.xHiveWorkers = {}
+        self.xHiveMonitors = {}
+        self.xHiveMonitors = {}
+
+class PARSNIP(PARSNIPMonitor):
+    def __init__(self, root):
+        super().__init__()
+        self.root = root
+        self.bAutoRefresh = False
+        self.allData = RegistrySnapshot().finalize()  # Current snapshot; the same object becomes xPreviousData
+        self.xViewData = self.allData  # Snapshot behind the key treeview
+        self.xViewPositions = np.arange(0)  # Positions in xViewData of the displayed rows, in display order
+        self.xSortCache = {}  # Column -> (ascending order, rank) over xViewData
+        self.xSearchIndex = None
+        self.sSearchAfterId = None
+        self.xViewLines = []
+        self.nViewTop = 0
+        self.nViewRows = 10
+        self.xRefreshWorker = ThreadPoolExecutor(max_workers=1)
+        self.xRefreshFuture = None
+        self.xRefreshQueue = queue.Queue()
+        self.bRefreshPending = False
+        self.sMetricsPath = os.path.join(self.sOutputDir, "parsnip_metrics.jsonl")
+        self.setupUI()
+
     def setupUI(self):
         # Input frame for basic parameters
         xInputFrame = ttk.Frame(self.root)
@@ -193,6 +2044,21 @@ class PARSNIP:
         self.xClassCsvInput.grid(row=0, column=4, padx=(0,5), pady=5, sticky='w')
         self.xClassCsvSetButton = ttk.Button(xMLFrame, text="Set CSV", command=self.setClassifiedCsvPath)
         self.xClassCsvSetButton.grid(row=0, column=5, padx=(5,0), pady=5, sticky='w')
+        ttk.Label(xMLFrame, text="Classified Store Dir (optional):").grid(row=1, column=3, padx=(20,10), pady=5, sticky='e')
+        self.xClassStoreInput = ttk.Entry(xMLFrame, width=50)
+        self.xClassStoreInput.grid(row=1, column=4, padx=(0,5), pady=5, sticky='w')
+        self.xClassStoreSetButton = ttk.Button(xMLFrame, text="Set Store", command=self.setClassifiedStoreDir)
+        self.xClassStoreSetButton.grid(row=1, column=5, padx=(5,0), pady=5, sticky='w')
+        ttk.Label(xMLFrame, text="Baseline Store Dir (optional):").grid(row=1, column=0, padx=(0,10), pady=5, sticky='e')
+        self.xBaselineInput = ttk.Entry(xMLFrame, width=50)
+        self.xBaselineInput.grid(row=1, column=1, padx=(0,5), pady=5, sticky='w')
+        self.xBaselineSetButton = ttk.Button(xMLFrame, text="Set Baselines", command=self.setBaselineDir)
+        self.xBaselineSetButton.grid(row=1, column=2, padx=(5,20), pady=5, sticky='w')
+        ttk.Label(xMLFrame, text="Delta Export Dir (optional):").grid(row=2, column=0, padx=(0,10), pady=5, sticky='e')
+        self.xDeltaInput = ttk.Entry(xMLFrame, width=50)
+        self.xDeltaInput.grid(row=2, column=1, padx=(0,5), pady=5, sticky='w')
+        self.xDeltaSetButton = ttk.Button(xMLFrame, text="Set Delta Dir", command=self.setDeltaDir)
+        self.xDeltaSetButton.grid(row=2, column=2, padx=(5,20), pady=5, sticky='w')
         # Treeview for displaying registry keys
         self.xKeyTrees = ttk.Treeview(self.root, columns=('Name', 'Value', 'Type', 'Subkey Count', 'Value Count', 'Key Size', 'Depth'), show='tree headings', selectmode="browse")
         self.xKeyTrees.heading('#0', text='Key', command=lambda: self.sortTreeview('#0', False))
@@ -211,15 +2077,20 @@ class PARSNIP:
         self.xKeyTrees.column('Value Count', width=100, anchor='center')
         self.xKeyTrees.column('Key Size', width=100, anchor='center')
         self.xKeyTrees.column('Depth', width=100, anchor='center')
-        xVsb = ttk.Scrollbar(self.root, orient="vertical", command=self.xKeyTrees.yview)
+        # The vertical scrollbar drives the virtual row window rather than the Treeview's own items
+        self.xKeyTreesVsb = ttk.Scrollbar(self.root, orient="vertical", command=self.scrollGUITrees)
         xHsb = ttk.Scrollbar(self.root, orient="horizontal", command=self.xKeyTrees.xview)
-        self.xKeyTrees.configure(yscrollcommand=xVsb.set, xscrollcommand=xHsb.set)
+        self.xKeyTrees.configure(xscrollcommand=xHsb.set)
+        self.xKeyTrees.bind('<MouseWheel>', lambda e: self.scrollGUITrees('scroll', -3 if e.delta > 0 else 3, 'units'))
+        self.xKeyTrees.bind('<Button-4>', lambda e: self.scrollGUITrees('scroll', -3, 'units'))
+        self.xKeyTrees.bind('<Button-5>', lambda e: self.scrollGUITrees('scroll', 3, 'units'))
+        self.xKeyTrees.bind('<Configure>', self.resizeGUITrees)
         self.xKeyTrees.tag_configure('key', background='lightblue')
         self.xKeyTrees.tag_configure('name', background='lightgreen')
         self.xKeyTrees.tag_configure('value', background='lightyellow')
         self.xKeyTrees.tag_configure('type', background='lightpink')
         self.xKeyTrees.grid(row=2, column=0, columnspan=3, sticky='nsew')
-        xVsb.grid(row=2, column=3, sticky='ns')
+        self.xKeyTreesVsb.grid(row=2, column=3, sticky='ns')
         xHsb.grid(row=3, column=0, columnspan=3, sticky='ew')
         # Frame for auto-refresh buttons
         xAutoRefreshButtonFrame = ttk.Frame(self.root)
@@ -228,6 +2099,10 @@ class PARSNIP:
         self.xRefreshButton.grid(row=0, column=0, padx=5)
         self.xAutoRefreshButton = ttk.Button(xAutoRefreshButtonFrame, text="Enable Auto Refresh", command=self.toggleAutoRefreshPARSNIP)
         self.xAutoRefreshButton.grid(row=0, column=1, padx=5)
+        self.xCancelButton = ttk.Button(xAutoRefreshButtonFrame, text="Cancel", command=self.cancelRefreshPARSNIP, state='disabled')
+        self.xCancelButton.grid(row=0, column=2, padx=5)
+        self.xProfileButton = ttk.Button(xAutoRefreshButtonFrame, text="Profile Next Refresh", command=self.profileNextRefresh)
+        self.xProfileButton.grid(row=0, column=3, padx=5)
         # Search frame for filtering keys
         xSearchFrame = ttk.Frame(self.root)
         xSearchFrame.grid(row=5, column=0, columnspan=3, pady=5, sticky='ew')
@@ -238,6 +2113,14 @@ class PARSNIP:
         self.xSearchButton.grid(row=0, column=2, padx=5, pady=5)
         self.xClearSearchButton = ttk.Button(xSearchFrame, text="Clear Search", command=self.clearSearch)
         self.xClearSearchButton.grid(row=0, column=3, padx=5, pady=5)
+        self.xSearchMode = ttk.Combobox(xSearchFrame, values=["Substring", "Prefix", "Regex"], state='readonly', width=10)
+        self.xSearchMode.set("Substring")
+        self.xSearchMode.grid(row=0, column=4, padx=5, pady=5)
+        self.xSearchScope = ttk.Combobox(xSearchFrame, values=["All Fields", "Key", "Name", "Value"], state='readonly', width=10)
+        self.xSearchScope.set("All Fields")
+        self.xSearchScope.grid(row=0, column=5, padx=5, pady=5)
+        self.xSearchInput.bind('<KeyRelease>', self.scheduleSearch)
+        self.xSearchInput.bind('<Return>', lambda e: self.searchKeys())
         # Frame for changes list
         self.xChangesFrame = ttk.Frame(self.root)
         self.xChangesFrame.grid(row=6, column=2, columnspan=3, sticky='nsew')
@@ -256,104 +2139,46 @@ class PARSNIP:
         # Loading Label
         self.xLoadingLabel = ttk.Label(self.root, text="", anchor='center', font=('Arial', 10, 'italic'))
         self.xLoadingLabel.grid(row=7, column=0, columnspan=3, pady=10, sticky='s')
+        # Stage timings of the last refresh cycle
+        self.xMetricsLabel = ttk.Label(self.root, text="", anchor='center', font=('Arial', 9))
+        self.xMetricsLabel.grid(row=8, column=0, columnspan=3, pady=(0, 10), sticky='s')
 
-    # Registry parsing
-    def parseRegistry(self, hive_path):
-        xData = []
-        subkey_counts = {}
-        try:
-            with ThreadPoolExecutor() as executor:
-                hive = RegistryHive(hive_path)
-                for subkey in hive.recurse_subkeys():
-                    kpath = subkey.path
-                    parent_path = '\\'.join(kpath.split('\\')[:-1])
-                    subkey_counts[parent_path] = subkey_counts.get(parent_path, 0) + 1
-                    depth = kpath.count('\\')
-                    ksize = len(kpath.encode('utf-8'))
-                    vcount = len(subkey.values)
-                    scount = subkey_counts.get(kpath, 0)
-                    for val in subkey.values:
-                        xData.append({
-                            "Key": kpath,
-                            "Depth": depth,
-                            "Key Size": ksize,
-                            "Subkey Count": scount,
-                            "Value Count": vcount,
-                            "Name": str(val.name) if val.name else "0",
-                            "Value": str(val.value) if val.value else "0",
-                            "Type": str(val.value_type) if val.value_type else "0"
-                        })
-            self.preprocessAndExport(xData)
-        except Exception as e:
-            messagebox.showerror("Error", f"Error parsing hive: {e}")
-        return xData
-
-    # Classification of changes
-    def classifyChanges(self, changes_df):
-        if changes_df.empty:
-            return changes_df
-
-        actions = changes_df["Action"] if "Action" in changes_df.columns else None
-        proc_df = self.preprocessData(changes_df)
-        df_unified = self.unifyFinalColumns(proc_df).copy()
-
-        # Add the preserved "Action" column back into the unified DataFrame for refernece
-        if actions is not None:
-            df_unified["Action"] = actions.values
-
-        if not self.sRandomForestPath or not os.path.exists(self.sRandomForestPath):
-            messagebox.showerror("Error", "Random Forest model file not set or not found.")
-            df_unified.loc[:, 'Predicted Label'] = "Unclassified"
-            df_unified.loc[:, 'Change Detected Datetime'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            return df_unified
-
-        model = joblib.load(self.sRandomForestPath)
-        if hasattr(model, "feature_names_in_"):
-            selected = model.feature_names_in_
-            try:
-                X = df_unified.loc[:, selected].copy()
-            except KeyError:
-                messagebox.showerror("Error", "Some expected feature columns are missing in the input data.")
-                df_unified.loc[:, 'Predicted Label'] = "Unclassified"
-                df_unified.loc[:, 'Change Detected Datetime'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                return df_unified
-        else:
-            non_features = ['Key', 'Name', 'Value', 'Type', 'Path Category', 'Type Group', 'Key Name Category', 'Label', 'Tactic']
-            X = df_unified.drop(columns=non_features, errors='ignore').copy()
-
-        for col in X.columns:
-            X[col] = pd.to_numeric(X[col], errors='coerce').fillna(0)
+    # Virtualized treeview: rows live in xViewData, xViewPositions holds the displayed rows in display order,
+    # and only the lines in view are materialized as Tk items. Consecutive rows sharing a key share one key node.
+    def loadGUITrees(self, snapshot):
+        self.xViewData = snapshot
+        self.xSortCache = {}
+        self.showGUIRows(np.arange(len(snapshot)))
 
-        y_scores = model.predict_proba(X)[:, 1]
-        df_unified.loc[:, 'Predicted Label'] = np.where(y_scores >= 0.5, 'Malicious', 'Benign')
-        df_unified.loc[:, 'Change Detected Datetime'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        return df_unified
+    def showGUIRows(self, positions):
+        self.xViewPositions = positions
+        # A line is either a row position, or -1 - pos for the key node of the group starting at pos
+        value_key = self.xViewData.xValueKey[positions]
+        group_starts = np.flatnonzero(np.r_[True, value_key[1:] != value_key[:-1]]) if len(positions) else np.arange(0)
+        lines = np.empty(len(positions) + len(group_starts), dtype=np.int64)
+        header_slots = group_starts + np.arange(len(group_starts))
+        is_header = np.zeros(len(lines), dtype=bool)
+        is_header[header_slots] = True
+        lines[header_slots] = -1 - positions[group_starts]
+        lines[~is_header] = positions
+        self.xViewLines = lines
+        self.nViewTop = 0
+        self.renderGUITrees()
 
-    def appendClassifiedCsv(self, df):
-        if df.empty:
-            return
-        if self.sClassifiedCsvPath and os.path.exists(self.sClassifiedCsvPath):
-            try:
-                existing = pd.read_csv(self.sClassifiedCsvPath, dtype=str)
-                combined = pd.concat([existing, df], ignore_index=True)
-                combined.to_csv(self.sClassifiedCsvPath, index=False)
-            except Exception:
-                df.to_csv(self.sClassifiedCsvPath, index=False)
-        else:
-            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-            new_csv = os.path.join(sScriptPath, f"classified_changes_{ts}.csv")
-            df.to_csv(new_csv, index=False)
-            self.sClassifiedCsvPath = new_csv
-            self.xClassCsvInput.delete(0, tk.END)
-            self.xClassCsvInput.insert(0, new_csv)
-            messagebox.showinfo("CSV Created", f"Classified CSV created at: {new_csv}")
-
-    # Load data into the treeview
-    def loadGUITrees(self, xData):
+    def renderGUITrees(self):
         self.xKeyTrees.delete(*self.xKeyTrees.get_children())
-        for entry in xData:
-            # Insert the parent with the "key" tag to color it blue
-            parent = self.xKeyTrees.insert('', 'end', text=entry['Key'], open=True, tags=('key',))
+        data = self.xViewData
+        window = self.xViewLines[self.nViewTop:self.nViewTop + self.nViewRows + nViewBuffer].tolist()
+        parent = ''
+        if window and window[0] >= 0:
+            # The window starts inside a group, so repeat its key node above the first value
+            parent = self.xKeyTrees.insert('', 'end', text=data.row(window[0])['Key'], open=True, tags=('key',))
+        for line in window:
+            if line < 0:
+                # Insert the parent with the "key" tag to color it blue
+                parent = self.xKeyTrees.insert('', 'end', text=data.row(-1 - line)['Key'], open=True, tags=('key',))
+                continue
+            entry = data.row(line)
             self.xKeyTrees.insert(parent, 'end', values=(
                 entry.get('Name', ''),
                 entry.get('Value', ''),
@@ -363,140 +2188,174 @@ class PARSNIP:
                 entry.get('Key Size', ''),
                 entry.get('Depth', '')
             ))
+        total = len(self.xViewLines)
+        if total:
+            self.xKeyTreesVsb.set(self.nViewTop / total, min(1.0, (self.nViewTop + self.nViewRows) / total))
+        else:
+            self.xKeyTreesVsb.set(0.0, 1.0)
 
-    # Change detection: compare previous and current snapshot
-    def checkChanges(self, previous, current):
-        changes = []
-        unmatched_prev = previous.copy()
-
-        # Compare each current entry against previous entries using a composite key
-        for curr in current:
-            # Create a composite key tuple for the current entry
-            curr_key = (curr.get("Key"), curr.get("Name"), curr.get("Type"))
-            found_match = None
-
-            # Search for a matching entry in the previous snapshot
-            for prev in unmatched_prev:
-                prev_key = (prev.get("Key"), prev.get("Name"), prev.get("Type"))
-                if curr_key == prev_key:
-                    found_match = prev
-                    break
+    def scrollGUITrees(self, *args):
+        total = len(self.xViewLines)
+        if args[0] == 'moveto':
+            top = int(float(args[1]) * total)
+        else:
+            step = self.nViewRows if args[2] == 'pages' else 1
+            top = self.nViewTop + int(args[1]) * step
+        top = min(max(0, top), max(0, total - self.nViewRows))
+        if top != self.nViewTop:
+            self.nViewTop = top
+            self.renderGUITrees()
+        return "break"
 
-            if found_match:
-                # Remove the matched previous entry so it is not processed again
-                unmatched_prev.remove(found_match)
-                # If any field differs, mark as modified
-                if curr != found_match:
-                    entry = curr.copy()
-                    entry['Action'] = 'Modified'
-                    changes.append(entry)
-            else:
-                # No matching previous entry found means this entry was added
-                entry = curr.copy()
-                entry['Action'] = 'Added'
-                changes.append(entry)
+    def resizeGUITrees(self, event):
+        row_height = int(ttk.Style().lookup('Treeview', 'rowheight') or 20)
+        # One row is taken by the column headings
+        rows = max(1, event.height // row_height - 1)
+        if rows != self.nViewRows:
+            self.nViewRows = rows
+            self.renderGUITrees()
+
+    # Thread-safe notifications: the refresh worker queues dialogs and progress for the Tk thread
+    def showMessage(self, sKind, sTitle, sMessage):
+        if threading.current_thread() is threading.main_thread():
+            getattr(messagebox, f"show{sKind}")(sTitle, sMessage)
+        else:
+            self.xRefreshQueue.put(("message", (sKind, sTitle, sMessage)))
 
-        # Any entries left in unmatched_prev were removed
-        for prev in unmatched_prev:
-            entry = prev.copy()
-            entry['Action'] = 'Removed'
-            changes.append(entry)
+    def reportProgress(self, sText):
+        if self.xCancelEvent.is_set():
+            raise RefreshCancelled()
+        self.xRefreshQueue.put(("progress", sText))
 
-        return pd.DataFrame(changes)
+    def reportCsvPath(self, sPath):
+        self.xRefreshQueue.put(("csvpath", sPath))
 
     # Main refresh: parse hive, detect changes, classify, and update UI
     def refreshPARSNIP(self):
+        # Coalesce requests that arrive while a cycle is running into a single follow-up cycle
+        if self.xRefreshFuture is not None and not self.xRefreshFuture.done():
+            self.bRefreshPending = True
+            return
+        self.xCancelEvent.clear()
         self.xLoadingLabel.config(text="Loading...")
-        self.root.update_idletasks()
+        self.xRefreshButton.config(state='disabled')
+        self.xCancelButton.config(state='normal')
+        self.xRefreshFuture = self.xRefreshWorker.submit(self.runRefreshCycle)
+        self.root.after(100, self.pollRefreshQueue)
 
-        if self.isLiveHive(self.sHivePath):
-            self.exportRegistry()
-            parsed_path = getattr(self, 'sExportPath', self.sHivePath)
-        else:
-            parsed_path = self.sHivePath
+    def cancelRefreshPARSNIP(self):
+        self.bRefreshPending = False
+        self.xCancelEvent.set()
+        self.xLoadingLabel.config(text="Cancelling...")
 
-        if os.path.exists(parsed_path):
-            # Get the base hive name and normalize it by removing trailing " (number)"
-            base_hive = os.path.basename(parsed_path).split('.')[0].lower()
-            hive_type = re.sub(r'\s*\(\d+\)$', '', base_hive)
-            if hive_type != self.sPreviousHiveType:
-                self.xChangesList.delete(*self.xChangesList.get_children())
-                self.xPreviousData = None
-                self.sPreviousHiveType = hive_type
+    def runRefreshCycle(self):
+        # Runs on the worker thread; Tk widgets are only touched from applyRefreshResult
+        try:
+            result = self.runMonitorCycle()
+            if result["current"] is not None and not result["bUnchanged"]:
+                self.reportProgress("Indexing snapshot for search...")
+                with self.measureStage("indexSearch", len(result["current"])):
+                    result["search"] = SearchIndex(result["current"])
+            self.xRefreshQueue.put(("done", result))
+        except RefreshCancelled:
+            self.xRefreshQueue.put(("cancelled", None))
+        except Exception as e:
+            self.xRefreshQueue.put(("error", str(e)))
 
-            current_data = self.parseRegistry(parsed_path)
-            self.allData = current_data
-            self.loadGUITrees(current_data)
+    def pollRefreshQueue(self):
+        while True:
+            try:
+                sEvent, payload = self.xRefreshQueue.get_nowait()
+            except queue.Empty:
+                break
+            if sEvent == "progress":
+                self.xLoadingLabel.config(text=payload)
+            elif sEvent == "message":
+                self.showMessage(*payload)
+            elif sEvent == "csvpath":
+                self.xClassCsvInput.delete(0, tk.END)
+                self.xClassCsvInput.insert(0, payload)
+            else:
+                if sEvent == "done":
+                    self.applyRefreshResult(payload)
+                elif sEvent == "error":
+                    messagebox.showerror("Error", f"Refresh failed: {payload}")
+                self.finishRefresh()
+                return
+        self.root.after(100, self.pollRefreshQueue)
 
-            if self.xPreviousData is not None:
-                changes = self.checkChanges(self.xPreviousData, current_data)
-                if not changes.empty:
-                    classified = self.classifyChanges(changes)
-                    self.appendClassifiedCsv(classified)
+    def applyRefreshResult(self, result):
+        if result["bHiveChanged"]:
+            self.xChangesList.delete(*self.xChangesList.get_children())
+        if result["current"] is not None and not result["bUnchanged"]:
+            with self.measureStage("loadGUITrees", len(result["current"])):
+                self.allData = result["current"]
+                self.xSearchIndex = result["search"]
+                self.loadGUITrees(self.allData)
+                classified = result["classified"]
+                if classified is not None:
                     for idx, row in classified.iterrows():
                         tag = "Malicious" if row["Predicted Label"] == "Malicious" else "Benign"
                         self.xChangesList.insert("", "end", values=(
                             row["Action"],
-                            f"{row['Key']} => {row['Predicted Label']} at {row['Change Detected Datetime']}"
+                            f"{row['Key']} => {row['Predicted Label']} ({row['Decided By'] or 'Unscored'}) at {row['Change Detected Datetime']}"
                         ), tags=(tag,))
-            self.xPreviousData = current_data
-            self.exportToCSV(current_data, 'snapshot')
-        self.xLoadingLabel.config(text="")
+        self.recordCycleMetrics(self.sHivePath, result["metrics"])
+        self.xMetricsLabel.config(text=self.formatCycleMetrics(result["metrics"]))
 
-    # CSV Export helpers
-    def exportToCSV(self, data, prefix):
-        columns = ["Key", "Name", "Value", "Type", "Subkey Count", "Value Count", "Key Size", "Depth"]
-        df = pd.DataFrame(data, columns=columns)
-        df.dropna(axis=1, how='all', inplace=True)
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        out_csv = os.path.join(sScriptPath, f"{prefix}_{ts}.csv")
-        if len(df) > self.nEntryLimit:
-            df = df.head(self.nEntryLimit)
-        df.to_csv(out_csv, index=False)
-        messagebox.showinfo("Export Complete", f"Data exported to: {out_csv}")
+    def finishRefresh(self):
+        self.xLoadingLabel.config(text="")
+        self.xRefreshButton.config(state='normal')
+        self.xCancelButton.config(state='disabled')
+        if self.bRefreshPending:
+            self.bRefreshPending = False
+            self.refreshPARSNIP()
 
     def exportSortedCSV(self):
         columns = ["Key", "Name", "Value", "Type", "Subkey Count", "Value Count", "Key Size", "Depth"]
-        data = []
-        for parent in self.xKeyTrees.get_children(''):
-            key_text = self.xKeyTrees.item(parent, 'text')
-            for child in self.xKeyTrees.get_children(parent):
-                data.append({
-                    "Key": key_text,
-                    "Name": self.xKeyTrees.set(child, 'Name'),
-                    "Value": self.xKeyTrees.set(child, 'Value'),
-                    "Type": self.xKeyTrees.set(child, 'Type'),
-                    "Subkey Count": self.xKeyTrees.set(child, 'Subkey Count'),
-                    "Value Count": self.xKeyTrees.set(child, 'Value Count'),
-                    "Key Size": self.xKeyTrees.set(child, 'Key Size'),
-                    "Depth": self.xKeyTrees.set(child, 'Depth')
-                })
-        df = pd.DataFrame(data, columns=columns)
-        df.dropna(axis=1, how='all', inplace=True)
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        out_csv = os.path.join(sScriptPath, f"snapshot_sorted_{ts}.csv")
-        df.to_csv(out_csv, index=False)
-        messagebox.showinfo("Export Complete", f"Sorted data exported to: {out_csv}")
+        batches = (batch[columns] for batch in self.iterSnapshotBatches(self.xViewData, self.xViewPositions, len(self.xViewPositions)))
+        out_path = self.exportBatches(batches, "snapshot_sorted")
+        if out_path:
+            messagebox.showinfo("Export Complete", f"Sorted data exported to: {out_path}")
+
+    def getSortOrder(self, col):
+        # Ascending order and rank of every snapshot row for a column, computed once per snapshot
+        if col not in self.xSortCache:
+            snapshot = self.xViewData
+            if col == '#0':
+                # Rank the key table once, then order the values by their key's rank
+                keys = [k.lower() for k in snapshot.xKeys]
+                key_rank = np.empty(len(keys), dtype=np.int64)
+                key_rank[sorted(range(len(keys)), key=keys.__getitem__)] = np.arange(len(keys))
+                order = np.argsort(key_rank[snapshot.xValueKey], kind='stable')
+            elif col in xNumericViewColumns:
+                order = np.argsort(snapshot.column(col), kind='stable')
+            else:
+                keys = [str(v) for v in snapshot.column(col)]
+                order = np.array(sorted(range(len(keys)), key=keys.__getitem__), dtype=np.int64)
+            rank = np.empty_like(order)
+            rank[order] = np.arange(len(order))
+            self.xSortCache[col] = (order, rank)
+        return self.xSortCache[col]
 
     def sortTreeview(self, col, reverse):
-        items = []
-        if col == '#0':
-            for it in self.xKeyTrees.get_children(''):
-                key_text = self.xKeyTrees.item(it, 'text')
-                items.append((key_text, it))
-            sorted_items = sorted(items, key=lambda x: x[0].lower(), reverse=reverse)
-            for idx, itm in enumerate(sorted_items):
-                self.xKeyTrees.move(itm[1], '', idx)
+        # Sort with the cached permutation and re-render; Tk items are never read back or moved
+        order, rank = self.getSortOrder(col)
+        positions = self.xViewPositions
+        if len(positions) == len(order):
+            positions = order
         else:
-            for parent in self.xKeyTrees.get_children(''):
-                parent_text = self.xKeyTrees.item(parent, 'text')
-                child_vals = [self.xKeyTrees.set(child, col) for child in self.xKeyTrees.get_children(parent)]
-                items.append((parent_text, child_vals, parent))
-            sorted_items = sorted(items, key=lambda x: x[1][0], reverse=reverse)
-            for idx, itm in enumerate(sorted_items):
-                self.xKeyTrees.move(itm[2], '', idx)
+            # A filtered view is ordered by the rows' ranks in the full-snapshot permutation
+            positions = positions[np.argsort(rank[positions], kind='stable')]
+        self.showGUIRows(positions[::-1] if reverse else positions)
         self.xKeyTrees.heading(col, command=lambda: self.sortTreeview(col, not reverse))
-        self.exportSortedCSV()
+        # Delta exports keep the full snapshot already; sorting only re-renders
+        if not self.sDeltaDir:
+            self.exportSortedCSV()
+
+    def profileNextRefresh(self):
+        self.bProfileNextCycle = True
+        self.xLoadingLabel.config(text="The next refresh will be profiled")
 
     def toggleAutoRefreshPARSNIP(self):
         self.bAutoRefresh = not self.bAutoRefresh
@@ -539,110 +2398,289 @@ class PARSNIP:
         self.sClassifiedCsvPath = csvpath
         messagebox.showinfo("Path Set", f"Classified CSV set to: {csvpath}")
 
-    # Registry Export (Live Hive)
-    def exportRegistry(self):
-        hive_type = os.path.basename(self.sHivePath).split('.')[0].lower()
-        hive_ext = os.path.splitext(self.sHivePath)[1]
-        if hive_type == 'ntuser':
-            hive_param = 'HKCU'
-            self.sExportPath = os.path.join(sScriptPath, os.path.basename(self.sHivePath))
-        elif hive_type == 'system':
-            hive_param = 'HKLM\\System'
-            self.sExportPath = os.path.join(sScriptPath, os.path.basename(self.sHivePath) + hive_ext)
-        elif hive_type == 'software':
-            hive_param = 'HKLM\\Software'
-            self.sExportPath = os.path.join(sScriptPath, os.path.basename(self.sHivePath) + hive_ext)
-        elif hive_type == 'sam':
-            hive_param = 'HKLM\\SAM'
-            self.sExportPath = os.path.join(sScriptPath, os.path.basename(self.sHivePath) + hive_ext)
-        elif hive_type == 'security':
-            hive_param = 'HKLM\\SECURITY'
-            self.sExportPath = os.path.join(sScriptPath, os.path.basename(self.sHivePath) + hive_ext)
-        elif hive_type == 'hardware':
-            hive_param = 'HKLM\\HARDWARE'
-            self.sExportPath = os.path.join(sScriptPath, os.path.basename(self.sHivePath) + hive_ext)
-        else:
-            hive_param = 'HKLM'
-            self.sExportPath = os.path.join(sScriptPath, os.path.basename(self.sHivePath) + hive_ext)
-        try:
-            subprocess.check_call(['reg', 'save', hive_param, self.sExportPath, '/y'])
-            messagebox.showinfo("Success", f"Unparsed Registry exported to: {self.sExportPath}")
-        except subprocess.CalledProcessError as e:
-            messagebox.showerror("Error", f"Error exporting registry: {e}")
+    def setClassifiedStoreDir(self):
+        storedir = self.xClassStoreInput.get().strip()
+        self.sClassifiedStoreDir = storedir
+        messagebox.showinfo("Path Set", f"Classified store set to: {storedir}" if storedir else "Classified store disabled")
 
-    def isLiveHive(self, path):
-        low = path.lower()
-        return ('system32' in low) or (low == sNtuserPath.lower())
+    def setBaselineDir(self):
+        basedir = self.xBaselineInput.get().strip()
+        self.sBaselineDir = basedir
+        messagebox.showinfo("Path Set", f"Baseline store set to: {basedir}" if basedir else "Baseline store disabled")
 
-    def searchKeys(self):
-        kw = self.xSearchInput.get().strip().lower()
-        if not self.allData:
-            messagebox.showinfo("Search", "No data loaded to search.")
+    def setDeltaDir(self):
+        deltadir = self.xDeltaInput.get().strip()
+        self.sDeltaDir = deltadir
+        self.xDeltaChain = None
+        messagebox.showinfo("Path Set", f"Delta exports go to: {deltadir}" if deltadir else "Delta exports disabled")
+
+    def scheduleSearch(self, event=None):
+        # Search as the user types, debounced so only the latest keystroke triggers a lookup
+        if self.sSearchAfterId is not None:
+            self.root.after_cancel(self.sSearchAfterId)
+        self.sSearchAfterId = self.root.after(150, lambda: self.searchKeys(bQuiet=True))
+
+    def searchKeys(self, bQuiet=False):
+        self.sSearchAfterId = None
+        kw = self.xSearchInput.get().strip()
+        if not len(self.allData) or self.xSearchIndex is None:
+            if not bQuiet:
+                messagebox.showinfo("Search", "No data loaded to search.")
+            return
+        if not kw:
+            self.showGUIRows(np.arange(len(self.xViewData)))
+            return
+        scope = self.xSearchScope.get()
+        fields = None if scope == "All Fields" else (scope,)
+        try:
+            positions = self.xSearchIndex.search(kw, self.xSearchMode.get(), fields)
+        except re.error as e:
+            if bQuiet:
+                self.xLoadingLabel.config(text=f"Invalid regex: {e}")
+            else:
+                messagebox.showerror("Error", f"Invalid regex: {e}")
             return
-        filtered = [row for row in self.allData if kw in row['Key'].lower()]
-        self.loadGUITrees(filtered)
+        self.xLoadingLabel.config(text=f"{len(positions)} matching values")
+        self.showGUIRows(positions)
 
     def clearSearch(self):
         self.xSearchInput.delete(0, tk.END)
-        self.loadGUITrees(self.allData)
+        self.xLoadingLabel.config(text="")
+        self.showGUIRows(np.arange(len(self.xViewData)))
 
-    def exportToCSV(self, data, prefix):
-        columns = ["Key", "Name", "Value", "Type", "Subkey Count", "Value Count", "Key Size", "Depth"]
-        df = pd.DataFrame(data, columns=columns)
-        df.dropna(axis=1, how='all', inplace=True)
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        out_csv = os.path.join(sScriptPath, f"{prefix}_{ts}.csv")
-        if len(df) > self.nEntryLimit:
-            df = df.head(self.nEntryLimit)
-        df.to_csv(out_csv, index=False)
-        messagebox.showinfo("Export Complete", f"Data exported to: {out_csv}")
+# Headless mode: hives given on the command line are parsed, diffed, classified and exported without a window
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser(description="PARSNIP registry monitor. Starts the GUI when no hive is given.")
+    parser.add_argument("hives", nargs="*", help="Hive files, or folders of collected hives processed in name order")
+    parser.add_argument("--system-hives", action="store_true", help="Also monitor SAM, SYSTEM, SOFTWARE, SECURITY and every user's NTUSER.DAT")
+    parser.add_argument("--daemon", action="store_true", help="Keep monitoring the hives, re-parsing every --interval seconds")
+    parser.add_argument("--interval", type=int, default=300, help="Seconds between parses in daemon mode")
+    parser.add_argument("--entry-limit", type=int, default=100, help="Rows written to the snapshot and preprocessed CSVs")
+    parser.add_argument("--model", default='', help="RandomForest model file used to classify changes")
+    parser.add_argument("--output-dir", default=sScriptPath, help="Directory for CSV outputs and exported live hives")
+    parser.add_argument("--classified-csv", default='', help="Classified changes CSV to append to")
+    parser.add_argument("--classified-store", default='', help="Day-partitioned Parquet store for classified changes")
+    parser.add_argument("--baseline-dir", default='', help="Versioned baseline store; diffing resumes from it after a restart")
+    parser.add_argument("--baseline-keep", type=int, default=100, help="Baseline versions kept per hive (0 keeps all)")
+    parser.add_argument("--delta-dir", default='', help="Export one compressed full snapshot per hive, then only each tick's changes, instead of the capped snapshot/preprocessed files")
+    parser.add_argument("--delta-rebase", type=int, default=1000, help="Deltas written before a new full snapshot is exported (0 never rebases)")
+    parser.add_argument("--reconstruct", metavar="HIVE_DELTA_DIR", help="Rebuild a hive's full snapshot from its --delta-dir folder and export it, instead of monitoring")
+    parser.add_argument("--at", type=datetime.fromisoformat, default=None, help="Time to reconstruct, e.g. \"2024-05-01 13:30\" (default: latest)")
+    parser.add_argument("--event-sink", default='', help="Stream classified changes as NDJSON to a file, named pipe, unix:SOCKET_PATH or tcp:HOST:PORT")
+    parser.add_argument("--event-queue", type=int, default=10000, help="Events buffered while the event reader is slow or away")
+    parser.add_argument("--event-block-seconds", type=float, default=0.0, help="Longest a cycle waits in total for room in a full event queue before dropping the rest of its events")
+    parser.add_argument("--inference-jobs", type=int, default=None, help="n_jobs for model inference (default: the model's own setting)")
+    parser.add_argument("--score-cache-size", type=int, default=100000, help="Distinct feature rows whose scores are cached between ticks")
+    parser.add_argument("--rules", default='', help="JSON file of allow/deny rules deciding changes before the model (checked before the built-in rules)")
+    parser.add_argument("--no-default-rules", action="store_true", help="Disable the built-in rules for known-benign churn and persistence keys")
+    parser.add_argument("--diff-baselines", nargs=2, metavar=("OLD", "NEW"), help="Diff two stored baseline files (and classify with --model) without parsing")
+    parser.add_argument("--train", nargs='+', metavar="CSV", help="Train --model from labeled snapshot, change or classified CSVs instead of monitoring")
+    parser.add_argument("--label-column", default="Label", help="Column of the training CSVs holding Malicious/Benign (or 1/0)")
+    parser.add_argument("--cv-folds", type=int, default=5, help="Cross-validation folds for the training grid search")
+    parser.add_argument("--train-jobs", type=int, default=-1, help="Parallel jobs for the training grid search (-1 = all cores)")
+    parser.add_argument("--rfe-features", type=int, default=0, help="Keep this many features by recursive feature elimination (0 keeps all)")
+    parser.add_argument("--export-format", default="csv", choices=["csv", "parquet"], help="Format of the snapshot and preprocessed exports")
+    parser.add_argument("--parse-workers", type=int, default=os.cpu_count() or 1, help="Processes for full parses of large hives (1 = serial)")
+    parser.add_argument("--split-depth", type=int, default=1, help="Key depth at which large hives are split into subtrees for the parse workers")
+    parser.add_argument("--metrics-file", default='', help="Append per-stage timings, rows and memory of every cycle to this JSON-lines file (rotated to .1)")
+    parser.add_argument("--profile-cycle", action="store_true", help="Write a cProfile stats file and tracemalloc report for the first cycle to --output-dir")
+    parser.add_argument("--log-file", default='', help="Log to this file instead of stderr")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    args = parser.parse_args(argv)
+    if args.daemon and any(os.path.isdir(path) for path in args.hives):
+        parser.error("--daemon monitors hive files, not folders of collected copies")
+    if args.train and not args.model:
+        parser.error("--train needs --model for the output model file")
+    if args.rules:
+        try:
+            monitor = PARSNIPMonitor()
+            monitor.compileChangeRules(monitor.readRulesFile(args.rules))
+        except (OSError, ValueError) as e:
+            parser.error(f"--rules: {e}")
+    if args.export_format == "parquet":
+        try:
+            import pyarrow
+        except ImportError:
+            parser.error("--export-format parquet needs pyarrow")
+    return args
 
-    def exportToCSV(self, data, prefix):
-        columns = ["Key", "Name", "Value", "Type", "Subkey Count", "Value Count", "Key Size", "Depth"]
-        df = pd.DataFrame(data, columns=columns)
-        df.dropna(axis=1, how='all', inplace=True)
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        out_csv = os.path.join(sScriptPath, f"{prefix}_{ts}.csv")
-        if len(df) > self.nEntryLimit:
-            df = df.head(self.nEntryLimit)
-        df.to_csv(out_csv, index=False)
-        messagebox.showinfo("Export Complete", f"Data exported to: {out_csv}")
+def findSystemHives():
+    config_dir = os.path.join(os.environ.get("SystemRoot", r"C:\Windows"), "System32", "config")
+    hives = [os.path.join(config_dir, name) for name in ("SAM", "SYSTEM", "SOFTWARE", "SECURITY")]
+    users_dir = os.path.join(os.environ.get("SystemDrive", "C:") + os.sep, "Users")
+    if os.path.isdir(users_dir):
+        for name in sorted(os.listdir(users_dir)):
+            ntuser = os.path.join(users_dir, name, "NTUSER.DAT")
+            if os.path.isfile(ntuser):
+                hives.append(ntuser)
+    return hives
 
-    def sortTreeview(self, col, reverse):
-        items = []
-        if col == '#0':
-            for it in self.xKeyTrees.get_children(''):
-                key_text = self.xKeyTrees.item(it, 'text')
-                items.append((key_text, it))
-            sorted_items = sorted(items, key=lambda x: x[0].lower(), reverse=reverse)
-            for idx, itm in enumerate(sorted_items):
-                self.xKeyTrees.move(itm[1], '', idx)
+def collectedHiveSortKey(sPath):
+    # Copies of one hive collected over time are named "ntuser.dat", "ntuser (1).dat", "ntuser (2).dat", ...;
+    # group them by hive type (as runMonitorCycle does) and order each group by copy number
+    name = os.path.basename(sPath)
+    base_hive = name.split('.')[0].lower()
+    copy = re.search(r'\s*\((\d+)\)$', base_hive)
+    return (re.sub(r'\s*\(\d+\)$', '', base_hive), int(copy.group(1)) if copy else 0, name.lower())
+
+def expandHivePaths(xPaths):
+    hives = []
+    for path in xPaths:
+        if os.path.isdir(path):
+            files = [os.path.join(path, name) for name in os.listdir(path) if os.path.isfile(os.path.join(path, name))]
+            hives.extend(sorted(files, key=collectedHiveSortKey))
         else:
-            for parent in self.xKeyTrees.get_children(''):
-                parent_text = self.xKeyTrees.item(parent, 'text')
-                child_vals = [self.xKeyTrees.set(child, col) for child in self.xKeyTrees.get_children(parent)]
-                items.append((parent_text, child_vals, parent))
-            sorted_items = sorted(items, key=lambda x: x[1][0], reverse=reverse)
-            for idx, itm in enumerate(sorted_items):
-                self.xKeyTrees.move(itm[2], '', idx)
-        self.xKeyTrees.heading(col, command=lambda: self.sortTreeview(col, not reverse))
-        self.exportSortedCSV()
+            hives.append(path)
+    return hives
 
-    def toggleAutoRefreshPARSNIP(self):
-        self.bAutoRefresh = not self.bAutoRefresh
-        self.xAutoRefreshButton.config(text="Disable Auto Refresh" if self.bAutoRefresh else "Enable Auto Refresh")
-        if self.bAutoRefresh:
-            self.autoRefreshPARSNIP()
+def groupHivePaths(xHivePaths):
+    # One group per hive (folder + hive type); each group keeps its own baseline and is diffed in the given order
+    groups = {}
+    for path in xHivePaths:
+        key = os.path.join(os.path.dirname(os.path.abspath(path)), collectedHiveSortKey(path)[0])
+        groups.setdefault(key, []).append(path)
+    return groups
 
-    def autoRefreshPARSNIP(self):
-        if self.bAutoRefresh:
-            self.refreshPARSNIP()
-            self.root.after(self.nInterval * 1000, self.autoRefreshPARSNIP)
+def runHeadless(args):
+    logging.basicConfig(level=args.log_level, filename=args.log_file or None, format="%(asctime)s %(levelname)s %(message)s")
+    if args.log_level != "DEBUG":
+        logging.getLogger("regipy").setLevel(logging.WARNING)
+    os.makedirs(args.output_dir, exist_ok=True)
+    hive_groups = groupHivePaths(expandHivePaths(args.hives) + (findSystemHives() if args.system_hives else []))
+    if args.daemon and any(len(paths) > 1 for paths in hive_groups.values()):
+        xLogger.error("--daemon needs one file per hive; got %s", [paths for paths in hive_groups.values() if len(paths) > 1])
+        return 2
+    if len(hive_groups) > 1:
+        # Several hives: each is parsed in its own worker process, in parallel
+        monitor = MultiHiveMonitor({"level": args.log_level, "filename": args.log_file or None, "format": "%(asctime)s %(levelname)s %(message)s"})
+    else:
+        monitor = PARSNIPMonitor()
+    monitor.nInterval = args.interval
+    monitor.nEntryLimit = args.entry_limit
+    monitor.sRandomForestPath = args.model
+    monitor.sOutputDir = args.output_dir
+    monitor.sClassifiedCsvPath = args.classified_csv
+    monitor.sClassifiedStoreDir = args.classified_store
+    monitor.nParseWorkers = args.parse_workers
+    monitor.sBaselineDir = args.baseline_dir
+    monitor.nBaselineKeep = args.baseline_keep
+    monitor.sDeltaDir = args.delta_dir
+    monitor.sEventSinkTarget = args.event_sink
+    monitor.nEventQueue = args.event_queue
+    monitor.fEventBlockSeconds = args.event_block_seconds
+    monitor.nDeltaRebase = args.delta_rebase
+    monitor.sExportFormat = args.export_format
+    monitor.nSplitDepth = max(1, args.split_depth)
+    monitor.nInferenceJobs = args.inference_jobs
+    monitor.nScoreCacheSize = args.score_cache_size
+    monitor.sRulesPath = args.rules
+    monitor.bDefaultRules = not args.no_default_rules
+    monitor.sMetricsPath = args.metrics_file
+    monitor.bProfileNextCycle = args.profile_cycle
+    # SIGTERM cancels the running cycle and ends the daemon instead of killing it mid-export
+    signal.signal(signal.SIGTERM, lambda signum, frame: monitor.xCancelEvent.set())
+    nFailures = 0
+    try:
+        while True:
+            try:
+                results, classified = monitor.runHiveCycles(hive_groups)
+            except RefreshCancelled:
+                xLogger.info("Stopped")
+                break
+            for result in results:
+                if "error" in result:
+                    xLogger.error("Refresh of %s failed: %s", result["sHivePath"], result["error"])
+                    nFailures += 1
+                elif result["nValues"] is None:
+                    xLogger.warning("Hive not found: %s", result["sHivePath"])
+                    nFailures += 1
+                elif result["bUnchanged"]:
+                    xLogger.info("%s: unchanged, %d values", result["sHivePath"], result["nValues"])
+                else:
+                    nChanges = 0 if result["changes"] is None else len(result["changes"])
+                    xLogger.info("%s: %d values, %d changes", result["sHivePath"], result["nValues"], nChanges)
+                if result.get("metrics"):
+                    xLogger.debug("%s: %s", result["sHivePath"], monitor.formatCycleMetrics(result["metrics"]))
+            if classified is not None:
+                nMalicious = int((classified["Predicted Label"] == "Malicious").sum())
+                xLogger.info("Classified %d changes, %d predicted malicious; %s; %s", len(classified), nMalicious, monitor.getInferenceSummary(), monitor.getRuleSummary())
+                if monitor.xEventSink is not None:
+                    xLogger.debug("Event sink %s: %s", monitor.sEventSinkTarget, monitor.xEventSink.getSummary())
+            if not args.daemon or monitor.xCancelEvent.wait(monitor.nInterval):
+                break
+    except KeyboardInterrupt:
+        xLogger.info("Interrupted")
+    finally:
+        monitor.closeEventSink()
+        if isinstance(monitor, MultiHiveMonitor):
+            monitor.shutdown()
+    return 1 if nFailures else 0
+
+def reconstructFromArguments(args):
+    logging.basicConfig(level=args.log_level, filename=args.log_file or None, format="%(asctime)s %(levelname)s %(message)s")
+    os.makedirs(args.output_dir, exist_ok=True)
+    monitor = PARSNIPMonitor()
+    monitor.sOutputDir = args.output_dir
+    monitor.sExportFormat = args.export_format
+    try:
+        snapshot = monitor.reconstructSnapshot(args.reconstruct, args.at)
+    except (OSError, ValueError) as e:
+        xLogger.error("Could not reconstruct %s: %s", args.reconstruct, e)
+        return 1
+    batches = (batch[xSnapshotColumns] for batch in monitor.iterSnapshotBatches(snapshot, nLimit=len(snapshot)))
+    out_path = monitor.exportBatches(batches, "reconstructed")
+    xLogger.info("%d values as of %s written to %s", len(snapshot), args.at or "the latest delta", out_path)
+    return 0
+
+def diffBaselines(args):
+    logging.basicConfig(level=args.log_level, filename=args.log_file or None, format="%(asctime)s %(levelname)s %(message)s")
+    os.makedirs(args.output_dir, exist_ok=True)
+    monitor = PARSNIPMonitor()
+    monitor.sRandomForestPath = args.model
+    monitor.sOutputDir = args.output_dir
+    monitor.nInferenceJobs = args.inference_jobs
+    monitor.sRulesPath = args.rules
+    monitor.bDefaultRules = not args.no_default_rules
+    previous, current = (RegistrySnapshot.load(path) for path in args.diff_baselines)
+    changes = monitor.checkChanges(previous, current)
+    if changes.empty:
+        xLogger.info("No changes between %s and %s", *args.diff_baselines)
+        return 0
+    if args.model:
+        changes = monitor.classifyChanges(changes)
+    out_csv = monitor.getOutputPath("baseline_changes")
+    changes.to_csv(out_csv, index=False)
+    xLogger.info("%d changes between %s and %s written to %s", len(changes), *args.diff_baselines, out_csv)
+    return 0
+
+def trainFromArguments(args):
+    logging.basicConfig(level=args.log_level, filename=args.log_file or None, format="%(asctime)s %(levelname)s %(message)s")
+    monitor = PARSNIPMonitor()
+    try:
+        report = monitor.trainModel(args.train, args.model, args.label_column, args.cv_folds, args.train_jobs, args.rfe_features)
+    except (OSError, ValueError) as e:
+        xLogger.error("Training failed: %s", e)
+        return 1
+    xLogger.info("Model saved to %s (%d rows, %d malicious, params %s)", args.model, report["rows"], report["malicious"], report["params"])
+    xLogger.info("Features: %s", ", ".join(report["features"]))
+    xLogger.info("Held-out metrics: %s", ", ".join(f"{name} {value:.3f}" for name, value in report["metrics"].items()))
+    return 0
 
-def main():
+def main(argv=None):
+    args = parseArguments(argv)
+    if args.train:
+        return trainFromArguments(args)
+    if args.diff_baselines:
+        return diffBaselines(args)
+    if args.reconstruct:
+        return reconstructFromArguments(args)
+    if args.hives or args.system_hives:
+        return runHeadless(args)
+    if tk is None:
+        sys.exit("Tk is not available; pass hive paths to run headless.")
     root = tk.Tk()
     app = PARSNIP(root)
     root.mainloop()
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,734 @@
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import platform
+import random
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import joblib
+import numpy as np
+import pandas as pd
+import regipy
+import sklearn
+from regipy import RegistryHive
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import MinMaxScaler, RobustScaler
+from PARSNIP import PARSNIPMonitor, MultiHiveMonitor, RegistrySnapshot, SearchIndex
+
+xValueTypes = ["REG_SZ", "REG_EXPAND_SZ", "REG_DWORD", "REG_QWORD", "REG_BINARY", "REG_MULTI_SZ"]
+xKeyLeaves = ["Settings", "CurrentVersion\\Run", "Services\\Svc", "Internet Settings", "Policies\\Explorer"]
+xValueNames = ["Value", "ProxyEnable", "AppInit_DLLs", "RunOnce", "Setting"]
+
+# Results of this run, written by --json so runs of different versions can be compared
+xResults = []
+
+def recordResult(sBenchmark, xParams, xMetrics):
+    # Metric names end in _s (seconds), _mib (memory) or _per_s (throughput); the rest are counts and ratios
+    xResults.append({"benchmark": sBenchmark, "params": xParams, "metrics": xMetrics})
+    values = {**xParams, **xMetrics}
+    print(sBenchmark + " " + " ".join(f"{sName}={value:.4g}" if isinstance(value, float) else f"{sName}={value}" for sName, value in values.items()))
+
+# Synthetic snapshot generation
+def generateSnapshot(nRows, nValuesPerKey=5, nSeed=0):
+    rng = random.Random(nSeed)
+    xData = []
+    nKeys = max(1, nRows // nValuesPerKey)
+    for k in range(nKeys):
+        kpath = f"ROOT\\Software\\Vendor{k % 97}\\Product{k % 1013}\\{xKeyLeaves[k % len(xKeyLeaves)]}\\Key{k}"
+        depth = kpath.count('\\')
+        ksize = len(kpath.encode('utf-8'))
+        for v in range(nValuesPerKey):
+            xData.append({
+                "Key": kpath,
+                "Depth": depth,
+                "Key Size": ksize,
+                "Subkey Count": 0,
+                "Value Count": nValuesPerKey,
+                "Name": f"{xValueNames[(k + v) % len(xValueNames)]}{v}",
+                "Value": str(rng.getrandbits(32)),
+                "Type": xValueTypes[v % len(xValueTypes)]
+            })
+    return xData[:nRows]
+
+def generateColumnarSnapshot(nRows, nValuesPerKey=5, nSeed=0):
+    # The same rows as generateSnapshot, built straight into a RegistrySnapshot
+    rng = random.Random(nSeed)
+    snapshot = RegistrySnapshot()
+    nKeys = max(1, nRows // nValuesPerKey)
+    for k in range(nKeys):
+        kpath = f"ROOT\\Software\\Vendor{k % 97}\\Product{k % 1013}\\{xKeyLeaves[k % len(xKeyLeaves)]}\\Key{k}"
+        kid = snapshot.addKey(kpath, kpath.count('\\'), len(kpath.encode('utf-8')), 0, nValuesPerKey)
+        for v in range(nValuesPerKey):
+            snapshot.addValue(kid, f"{xValueNames[(k + v) % len(xValueNames)]}{v}", str(rng.getrandbits(32)), xValueTypes[v % len(xValueTypes)])
+    return snapshot.finalize()
+
+def churnSnapshot(xData, fChurn=0.01, nSeed=1):
+    # Copy a snapshot and modify, remove and add roughly fChurn of its rows
+    rng = random.Random(nSeed)
+    xNew = [row.copy() for row in xData]
+    nChanges = max(1, int(len(xNew) * fChurn))
+    for pos in rng.sample(range(len(xNew)), nChanges):
+        xNew[pos]["Value"] = str(rng.getrandbits(32))
+    for _ in range(nChanges // 2):
+        xNew.pop(rng.randrange(len(xNew)))
+    for n in range(nChanges // 2):
+        row = xNew[rng.randrange(len(xNew))].copy()
+        row["Name"] = f"Added{n}"
+        xNew.append(row)
+    return xNew
+
+# Synthetic hive files
+nFiletimeBase = 132000000000000000
+nRegSz = 1
+nRegDword = 4
+
+def allocCell(xBuffer, payload):
+    # Append an allocated cell (negative size, 8-byte aligned) and return its offset from the first hbin
+    size = (len(payload) + 4 + 7) & ~7
+    offset = len(xBuffer)
+    xBuffer += struct.pack('<i', -size) + payload + b'\0' * (size - 4 - len(payload))
+    return offset
+
+def packKeyNode(sName, nFlags, nStamp, nSubkeys, nSubkeyList, nValues, nValueList, nLargestName, nLargestData):
+    name = sName.encode('ascii')
+    return b'nk' + struct.pack('<HQ4s14IHH', nFlags, nStamp, b'\0' * 4, 0, nSubkeys, 0, nSubkeyList, 0xFFFFFFFF,
+                               nValues, nValueList, 0xFFFFFFFF, 0xFFFFFFFF, len(name), 0, nLargestName, nLargestData, 0,
+                               len(name), 0) + name
+
+def writeSyntheticHive(sPath, nKeys=1000, nDepth=3, nValuesPerKey=5, nTick=0, nChurnKeys=0, nSeed=0):
+    # Keys form a tree of the given depth; each tick rewrites the values (and bumps the last-write time) of nChurnKeys keys
+    nFanout = max(2, round(nKeys ** (1.0 / nDepth)))
+    version = [0] * nKeys
+    for tick in range(1, nTick + 1):
+        for k in random.Random(nSeed * 1000003 + tick).sample(range(1, nKeys), min(nChurnKeys, nKeys - 1)):
+            version[k] = tick
+    children = [[] for _ in range(nKeys)]
+    for k in range(1, nKeys):
+        children[(k - 1) // nFanout].append(k)
+
+    xBuffer = bytearray(b'\0' * 32)
+    root_cell = allocCell(xBuffer, packKeyNode('ROOT', 0x24, 0, 0, 0, 0, 0, 0, 0))
+    offsets = [0] * nKeys
+    # Children are written before their parents so subkey lists can point at them
+    for k in range(nKeys - 1, -1, -1):
+        value_cells = []
+        largest_name = largest_data = 0
+        for v in range(nValuesPerKey):
+            name = f"Value{v}".encode('ascii')
+            if v % 2:
+                data_size, data_offset, data_type = 0x80000004, (k * 31 + v + version[k]) & 0xFFFFFFFF, nRegDword
+            else:
+                data = f"C:\\Program Files\\Vendor{k % 97}\\app{v}_{version[k]}.exe".encode('utf-16-le') + b'\0\0'
+                data_size, data_offset, data_type = len(data), allocCell(xBuffer, data), nRegSz
+            largest_name = max(largest_name, len(name) * 2)
+            largest_data = max(largest_data, data_size & 0x7FFFFFFF)
+            value_cells.append(allocCell(xBuffer, b'vk' + struct.pack('<HIIIHH', len(name), data_size, data_offset, data_type, 1, 0) + name))
+        value_list = allocCell(xBuffer, struct.pack(f'<{len(value_cells)}I', *value_cells)) if value_cells else 0xFFFFFFFF
+        subkeys = children[k]
+        if subkeys:
+            elements = b''.join(struct.pack('<II', offsets[c], 0) for c in subkeys)
+            subkey_list = allocCell(xBuffer, b'lf' + struct.pack('<H', len(subkeys)) + elements)
+        else:
+            subkey_list = 0xFFFFFFFF
+        node = packKeyNode(f"Key{k}" if k else 'ROOT', 0x24 if k == 0 else 0x20, nFiletimeBase + version[k] * 10_000_000,
+                           len(subkeys), subkey_list, len(value_cells), value_list, largest_name, largest_data)
+        if k == 0:
+            # The root key must be the first cell of the first hbin
+            xBuffer[root_cell + 4:root_cell + 4 + len(node)] = node
+            offsets[k] = root_cell
+        else:
+            offsets[k] = allocCell(xBuffer, node)
+
+    nDataSize = (len(xBuffer) + 4095) & ~4095
+    xBuffer += b'\0' * (nDataSize - len(xBuffer))
+    xBuffer[0:32] = b'hbin' + struct.pack('<III', 0, nDataSize, 0) + struct.pack('<IQI', 0, nFiletimeBase + nTick, 0)
+    header = b'regf' + struct.pack('<IIQIIIIIII', nTick + 1, nTick + 1, nFiletimeBase + nTick, 1, 5, 0, 1, root_cell, nDataSize, 1)
+    header += os.path.basename(sPath).encode('utf-16-le')[:64].ljust(64, b'\0') + b'\0' * 396
+    checksum = 0
+    for (word,) in struct.iter_unpack('<I', header):
+        checksum ^= word
+    header += struct.pack('<I', checksum)
+    with open(sPath, 'wb') as f:
+        f.write(header.ljust(4096, b'\0'))
+        f.write(xBuffer)
+    return sPath
+
+# Benchmarks
+def legacyCheckChanges(previous, current):
+    # The original quadratic scan, kept here as the reference implementation
+    changes = []
+    unmatched_prev = previous.copy()
+    for curr in current:
+        curr_key = (curr.get("Key"), curr.get("Name"), curr.get("Type"))
+        found_match = None
+        for prev in unmatched_prev:
+            if curr_key == (prev.get("Key"), prev.get("Name"), prev.get("Type")):
+                found_match = prev
+                break
+        if found_match:
+            unmatched_prev.remove(found_match)
+            if curr != found_match:
+                entry = curr.copy()
+                entry['Action'] = 'Modified'
+                changes.append(entry)
+        else:
+            entry = curr.copy()
+            entry['Action'] = 'Added'
+            changes.append(entry)
+    for prev in unmatched_prev:
+        entry = prev.copy()
+        entry['Action'] = 'Removed'
+        changes.append(entry)
+    return changes
+
+def legacyParseRegistry(hive_path):
+    # The original recurse_subkeys walk, kept here as the reference implementation
+    xData = []
+    subkey_counts = {}
+    for subkey in RegistryHive(hive_path).recurse_subkeys():
+        kpath = subkey.path
+        parent_path = '\\'.join(kpath.split('\\')[:-1])
+        subkey_counts[parent_path] = subkey_counts.get(parent_path, 0) + 1
+        for val in subkey.values:
+            xData.append({
+                "Key": kpath,
+                "Depth": kpath.count('\\'),
+                "Key Size": len(kpath.encode('utf-8')),
+                "Subkey Count": subkey_counts.get(kpath, 0),
+                "Value Count": len(subkey.values),
+                "Name": str(val.name) if val.name else "0",
+                "Value": str(val.value) if val.value else "0",
+                "Type": str(val.value_type) if val.value_type else "0"
+            })
+    return xData
+
+def newBenchApp():
+    # A headless monitor; CSV side effects are disabled so only the timed stage runs
+    app = PARSNIPMonitor()
+    app.preprocessAndExport = lambda xData, settings=None: None
+    return app
+
+def benchParseRegistry(nKeys, nChurnKeys, nDepth=3, nValuesPerKey=5):
+    # Offline hive file to rows: a full parse, then an incremental parse of the next tick
+    with tempfile.TemporaryDirectory() as sTempDir:
+        base = writeSyntheticHive(os.path.join(sTempDir, "base.dat"), nKeys=nKeys, nDepth=nDepth, nValuesPerKey=nValuesPerKey)
+        ticked = writeSyntheticHive(os.path.join(sTempDir, "tick.dat"), nKeys=nKeys, nDepth=nDepth, nValuesPerKey=nValuesPerKey, nTick=1, nChurnKeys=nChurnKeys)
+        app = newBenchApp()
+        start = time.perf_counter()
+        app.parseRegistry(base)
+        full = time.perf_counter() - start
+        start = time.perf_counter()
+        incremental = app.parseRegistry(ticked)
+        elapsed = time.perf_counter() - start
+        rows = [incremental.row(pos) for pos in range(len(incremental))]
+        assert rows == legacyParseRegistry(ticked), "incremental parse disagrees with a full parse"
+        recordResult("parseRegistry", {"keys": nKeys, "depth": nDepth, "values_per_key": nValuesPerKey, "churn_keys": nChurnKeys},
+                     {"rows": len(rows), "full_s": full, "incremental_s": elapsed, "full_rows_per_s": len(rows) / full})
+
+def benchUnchangedTick(nKeys, nChurnKeys, nDepth=3, nValuesPerKey=5):
+    # Monitor ticks over one hive file that is rewritten in place: an unchanged tick only reads the header
+    with tempfile.TemporaryDirectory() as sTempDir:
+        path = writeSyntheticHive(os.path.join(sTempDir, "monitored.dat"), nKeys=nKeys, nDepth=nDepth, nValuesPerKey=nValuesPerKey)
+        app = newBenchApp()
+        app.sOutputDir = sTempDir
+        app.sHivePath = path
+        start = time.perf_counter()
+        app.runMonitorCycle(bClassify=False)
+        first = time.perf_counter() - start
+        start = time.perf_counter()
+        result = app.runMonitorCycle(bClassify=False)
+        unchanged = time.perf_counter() - start
+        assert result["bUnchanged"], "unchanged hive was parsed again"
+        # Simulated update: the same file rewritten with churned keys and the next header sequence number
+        writeSyntheticHive(path, nKeys=nKeys, nDepth=nDepth, nValuesPerKey=nValuesPerKey, nTick=1, nChurnKeys=nChurnKeys)
+        start = time.perf_counter()
+        result = app.runMonitorCycle(bClassify=False)
+        changed = time.perf_counter() - start
+        assert not result["bUnchanged"] and result["changes"] is not None, "updated hive was not parsed"
+        recordResult("unchangedTick", {"keys": nKeys, "depth": nDepth, "values_per_key": nValuesPerKey, "churn_keys": nChurnKeys},
+                     {"first_s": first, "unchanged_s": unchanged, "changed_s": changed})
+
+def benchDeltaExport(nKeys, nTicks, nChurnKeys, nDepth=3, nValuesPerKey=5):
+    # Bytes and export time of nTicks monitor ticks: uncapped snapshot/preprocessed dumps vs one full snapshot plus
+    # deltas; the snapshot reconstructed from the deltas must equal the last parse
+    metrics = {}
+    with tempfile.TemporaryDirectory() as sTempDir:
+        for sMode in ("full", "delta"):
+            sOutputDir = os.path.join(sTempDir, sMode)
+            os.makedirs(sOutputDir)
+            path = writeSyntheticHive(os.path.join(sTempDir, f"{sMode}.dat"), nKeys=nKeys, nDepth=nDepth, nValuesPerKey=nValuesPerKey)
+            app = PARSNIPMonitor()
+            app.sOutputDir = sOutputDir
+            app.sHivePath = path
+            app.nEntryLimit = nKeys * nValuesPerKey
+            app.sDeltaDir = os.path.join(sOutputDir, "deltas") if sMode == "delta" else ''
+            fExport = 0.0
+            for nTick in range(nTicks + 1):
+                if nTick:
+                    writeSyntheticHive(path, nKeys=nKeys, nDepth=nDepth, nValuesPerKey=nValuesPerKey, nTick=nTick, nChurnKeys=nChurnKeys)
+                result = app.runMonitorCycle(bClassify=False)
+                fExport += sum(stage["seconds"] for stage in result["metrics"] if stage["stage"] in ("preprocessAndExport", "exportSnapshot", "exportDelta"))
+            nBytes = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(sOutputDir) for name in names)
+            metrics[f"{sMode}_mib"] = nBytes / 2**20
+            metrics[f"{sMode}_export_s"] = fExport
+        sHiveDir = os.path.join(app.sDeltaDir, os.listdir(app.sDeltaDir)[0])
+        start = time.perf_counter()
+        rebuilt = app.reconstructSnapshot(sHiveDir)
+        metrics["reconstruct_s"] = time.perf_counter() - start
+        last = app.xPreviousData
+        assert sorted(map(tuple, rebuilt.toFrame().values.tolist())) == sorted(map(tuple, last.toFrame().values.tolist())), "reconstructed snapshot differs from the last parse"
+    recordResult("deltaExport", {"keys": nKeys, "ticks": nTicks, "churn_keys": nChurnKeys, "values_per_key": nValuesPerKey}, metrics)
+
+def benchPartitionedParse(nKeys, xWorkers, nSplitDepth):
+    # Full parse of one hive split into subtrees, scaling from one (serial) to N parse workers. The monitor caps the
+    # workers at the CPU count, so counts above it would only repeat a smaller run and are skipped
+    nCpus = os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as sTempDir:
+        path = writeSyntheticHive(os.path.join(sTempDir, "large.dat"), nKeys=nKeys, nDepth=4)
+        reference = None
+        xMeasured = set()
+        for nWorkers in xWorkers:
+            if min(nWorkers, nCpus) in xMeasured:
+                print(f"partitionedParse workers={nWorkers} skipped: {nCpus} CPU(s), the parse would run with {min(nWorkers, nCpus)}")
+                continue
+            xMeasured.add(min(nWorkers, nCpus))
+            app = newBenchApp()
+            app.nParseWorkers = nWorkers
+            app.nSplitDepth = nSplitDepth
+            app.nPartitionedParseBytes = 0
+            start = time.perf_counter()
+            snapshot = app.parseRegistry(path)
+            elapsed = time.perf_counter() - start
+            rows = [snapshot.row(pos) for pos in range(len(snapshot))]
+            if reference is None:
+                reference = (elapsed, rows)
+            assert rows == reference[1], "partitioned parse disagrees with a serial parse"
+            recordResult("partitionedParse", {"keys": nKeys, "split_depth": nSplitDepth, "workers": min(nWorkers, nCpus), "cpus": nCpus},
+                         {"parse_s": elapsed, "speedup": reference[0] / elapsed})
+
+def benchMultiHive(nHives, nKeys, nChurnKeys, nDepth=3, nValuesPerKey=5):
+    # Refresh cycle over several hives: one in-process monitor per hive in turn, versus the multi-hive monitor, which
+    # runs one worker process per hive when there are cores for them and falls back to the serial in-process path
+    nCpus = os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as sTempDir:
+        groups = {}
+        for h in range(nHives):
+            base = writeSyntheticHive(os.path.join(sTempDir, f"hive{h}.dat"), nKeys=nKeys, nDepth=nDepth, nValuesPerKey=nValuesPerKey, nSeed=h)
+            ticked = writeSyntheticHive(os.path.join(sTempDir, f"hive{h} (1).dat"), nKeys=nKeys, nDepth=nDepth, nValuesPerKey=nValuesPerKey, nTick=1, nChurnKeys=nChurnKeys, nSeed=h)
+            groups[f"hive{h}"] = [base, ticked]
+        sequential_changes = {}
+        start = time.perf_counter()
+        for key, paths in groups.items():
+            monitor = PARSNIPMonitor()
+            monitor.sOutputDir = sTempDir
+            results, classified = monitor.runHiveCycles({key: paths})
+            sequential_changes[key] = len(results[-1]["changes"])
+        sequential = time.perf_counter() - start
+        monitor = MultiHiveMonitor()
+        monitor.sOutputDir = sTempDir
+        try:
+            start = time.perf_counter()
+            results, classified = monitor.runHiveCycles(groups)
+            multi = time.perf_counter() - start
+        finally:
+            monitor.shutdown()
+        assert classified["Hive"].value_counts().to_dict() == {groups[key][1]: n for key, n in sequential_changes.items()}, "multi-hive refresh disagrees with sequential"
+        sMode = "processes" if min(nCpus, nHives) > 1 else "serial"
+        recordResult("multiHive", {"hives": nHives, "keys": nKeys, "cpus": nCpus, "mode": sMode}, {"sequential_s": sequential, "multi_s": multi})
+
+def legacyPreprocessData(app, df):
+    # The original per-row .apply / get_dummies / unifyFinalColumns path, kept here as the reference implementation
+    xDf = df.copy()
+    xDf.fillna(xDf.select_dtypes(include=[np.number]).mean(), inplace=True)
+    xDf['Path Category'] = xDf['Key'].apply(app.categorizePath)
+    xDf = pd.concat([xDf, pd.get_dummies(xDf['Path Category'], prefix='PathCategory')], axis=1)
+    xDf['Type Group'] = xDf['Type'].apply(app.mapType)
+    xDf = pd.concat([xDf, pd.get_dummies(xDf['Type Group'], prefix='TypeGroup')], axis=1)
+    xDf['Key Name Category'] = xDf['Name'].apply(app.categorizeKeyName)
+    xDf = pd.concat([xDf, pd.get_dummies(xDf['Key Name Category'], prefix='KeyNameCategory')], axis=1)
+    xDf['Value Processed'] = xDf['Value'].apply(app.preprocessValue)
+    for col in ['Depth', 'Value Count', 'Value Processed']:
+        xDf[[col]] = MinMaxScaler().fit_transform(xDf[[col]])
+    for col in ['Key Size', 'Subkey Count']:
+        xDf[[col]] = RobustScaler().fit_transform(xDf[[col]])
+    return app.unifyFinalColumns(xDf)
+
+def benchPreprocessData(nRows):
+    app = newBenchApp()
+    df = pd.DataFrame(generateSnapshot(nRows))
+    start = time.perf_counter()
+    vectorized = app.preprocessData(df)
+    elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    legacy = legacyPreprocessData(app, df)
+    legacy_elapsed = time.perf_counter() - start
+    for col in app.get_expected_columns():
+        if col in ('Key', 'Name', 'Value', 'Type'):
+            assert (vectorized[col] == legacy[col]).all(), col
+        else:
+            assert np.allclose(vectorized[col].astype(float), legacy[col].astype(float)), col
+    recordResult("preprocessData", {"rows": nRows}, {"vectorized_s": elapsed, "legacy_s": legacy_elapsed, "vectorized_rows_per_s": nRows / elapsed})
+
+def benchInference(nRows):
+    # Scoring the same change rows on consecutive ticks: predict_proba over every row vs the batched score cache
+    app = newBenchApp()
+    features = app.preprocessData(generateColumnarSnapshot(nRows).toFrame(), bFitScalers=True)
+    features = features.drop(columns=['Key', 'Name', 'Value', 'Type', 'Path Category', 'Type Group', 'Key Name Category', 'Label', 'Tactic'], errors='ignore')
+    features = features.apply(pd.to_numeric, errors='coerce').fillna(0)
+    model = RandomForestClassifier(n_estimators=50, random_state=0).fit(features.head(20000), np.random.RandomState(0).randint(0, 2, min(20000, nRows)))
+    tracemalloc.start()
+    start = time.perf_counter()
+    legacy = model.predict_proba(features)[:, 1]
+    legacy_elapsed = time.perf_counter() - start
+    legacy_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    metrics = {"predict_proba_s": legacy_elapsed, "predict_proba_peak_mib": legacy_peak / 2**20}
+    for sTick in ("cold", "warm"):
+        tracemalloc.start()
+        start = time.perf_counter()
+        scores = app.scoreFeatures(model, features)
+        metrics[f"{sTick}_s"] = time.perf_counter() - start
+        metrics[f"{sTick}_peak_mib"] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+        assert np.array_equal(scores, legacy), "cached scores disagree with the model"
+    metrics["cache_hit_rate"] = app.xInferenceStats["nCacheHits"] / app.xInferenceStats["nRows"]
+    recordResult("inference", {"rows": nRows}, metrics)
+
+def buildBenchModel(app, sPath):
+    # The bundled model: a small forest fitted with fixed seeds on labeled synthetic rows, so every run classifies
+    # against the same trees without shipping a pickle tied to one sklearn version
+    app.sRandomForestPath = sPath
+    rows = generateColumnarSnapshot(20000, nSeed=7).toFrame()
+    features = app.featureMatrix(app.preprocessData(rows, bFitScalers=True)[app.getFeatureColumns()])
+    labels = (rows["Key"].str.contains("Run") & (rows["Value"].str.len() >= 10)).astype(np.int64)
+    joblib.dump(RandomForestClassifier(n_estimators=25, max_depth=8, random_state=0).fit(features, labels), sPath)
+
+def benchClassifyChanges(nRows, fChurn=0.01, nValuesPerKey=5):
+    # Preprocessing and scoring one tick's change set with the bundled model; the warm pass hits the score cache.
+    # Run with and without the built-in prefilter rules, which decide the synthetic Run key and AppInit_DLLs changes.
+    previous = RegistrySnapshot.fromRows(generateSnapshot(nRows, nValuesPerKey))
+    current = RegistrySnapshot.fromRows(churnSnapshot(generateSnapshot(nRows, nValuesPerKey), fChurn))
+    for bRules in (False, True):
+        with tempfile.TemporaryDirectory() as sTempDir:
+            app = newBenchApp()
+            app.sOutputDir = sTempDir
+            app.bDefaultRules = bRules
+            buildBenchModel(app, os.path.join(sTempDir, "bench_rf.joblib"))
+            changes = app.checkChanges(previous, current)
+            metrics = {"changes": len(changes)}
+            for sTick in ("cold", "warm"):
+                start = time.perf_counter()
+                classified = app.classifyChanges(changes)
+                metrics[f"{sTick}_s"] = time.perf_counter() - start
+            metrics["malicious"] = int((classified["Predicted Label"] == "Malicious").sum())
+            metrics["rule_decided"] = int(classified["Decided By"].str.startswith("Rule").sum())
+            recordResult("classifyChanges", {"rows": nRows, "churn": fChurn, "values_per_key": nValuesPerKey, "rules": bRules}, metrics)
+
+def benchEventSink(nRows, nLatencyEvents=50, fChurn=0.05):
+    # Classified changes streamed to a stand-in collector on a local TCP socket: bulk throughput, then the delay
+    # between emitting one change and the collector reading its line
+    previous = RegistrySnapshot.fromRows(generateSnapshot(nRows))
+    current = RegistrySnapshot.fromRows(churnSnapshot(generateSnapshot(nRows), fChurn))
+    app = newBenchApp()
+    classified = app.classifyChanges(app.checkChanges(previous, current))
+    server = socket.create_server(("127.0.0.1", 0))
+    xArrivals = []
+
+    def collect():
+        connection, _ = server.accept()
+        with connection, connection.makefile('rb') as stream:
+            for line in stream:
+                json.loads(line)
+                xArrivals.append(time.perf_counter())
+
+    collector = threading.Thread(target=collect)
+    collector.start()
+    app.sEventSinkTarget = f"tcp:127.0.0.1:{server.getsockname()[1]}"
+    app.nEventQueue = len(classified) + nLatencyEvents
+    start = time.perf_counter()
+    app.emitChangeEvents(classified)
+    fEmit = time.perf_counter() - start
+    while len(xArrivals) < len(classified):
+        time.sleep(0.001)
+    fDelivered = xArrivals[-1] - start
+    latencies = []
+    for pos in range(nLatencyEvents):
+        start = time.perf_counter()
+        app.emitChangeEvents(classified.iloc[[pos % len(classified)]])
+        while len(xArrivals) < len(classified) + pos + 1:
+            time.sleep(0.0001)
+        latencies.append(xArrivals[-1] - start)
+    app.closeEventSink()
+    collector.join()
+    server.close()
+    assert len(xArrivals) == len(classified) + nLatencyEvents, "the collector missed events"
+    recordResult("eventSink", {"events": len(classified)},
+                 {"emit_s": fEmit, "delivered_s": fDelivered, "events_per_s": len(classified) / fDelivered, "median_latency_s": float(np.median(latencies))})
+
+def benchCsvWriters(nRows, nAppends=10):
+    # The writers behind every cycle: a full snapshot export per format, and appending to the classified CSV
+    snapshot = generateColumnarSnapshot(nRows)
+    with tempfile.TemporaryDirectory() as sTempDir:
+        app = newBenchApp()
+        app.sOutputDir = sTempDir
+        app.nEntryLimit = nRows
+        metrics = {}
+        for sFormat in ["csv", "parquet"] if importlib.util.find_spec("pyarrow") else ["csv"]:
+            app.sExportFormat = sFormat
+            start = time.perf_counter()
+            app.exportToCSV(snapshot, "snapshot")
+            metrics[f"snapshot_{sFormat}_s"] = time.perf_counter() - start
+        classified = app.classifyChanges(snapshot.toFrame(np.arange(min(nRows, 10000))).assign(Action="Modified"))
+        start = time.perf_counter()
+        for nAppend in range(nAppends):
+            app.appendClassifiedCsv(classified)
+        metrics["classified_append_s"] = (time.perf_counter() - start) / nAppends
+        metrics["classified_rows"] = len(classified)
+        recordResult("csvWriters", {"rows": nRows}, metrics)
+
+def benchStartup(nRuns):
+    # Cold start in a fresh interpreter: importing PARSNIP and printing --help, against importing the heavy
+    # dependencies it defers until the first parse, preprocess or classification
+    sScript = os.path.join(os.path.dirname(os.path.abspath(__file__)), "PARSNIP.py")
+    commands = {
+        "import": [sys.executable, "-c", "import sys; sys.path.insert(0, sys.argv[1]); import PARSNIP", os.path.dirname(sScript)],
+        "help": [sys.executable, sScript, "--help"],
+        "deps": [sys.executable, "-c", "import pandas, numpy, joblib, regipy, sklearn.preprocessing"]
+    }
+    timings = {}
+    for sName, command in commands.items():
+        elapsed = []
+        for nRun in range(nRuns):
+            start = time.perf_counter()
+            subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+            elapsed.append(time.perf_counter() - start)
+        timings[sName] = min(elapsed)
+    recordResult("startup", {"runs": nRuns}, {"import_s": timings["import"], "help_s": timings["help"], "deferred_deps_s": timings["deps"]})
+
+def benchCheckChanges(sizes, nLegacyLimit, fChurn=0.01, nValuesPerKey=5):
+    app = newBenchApp()
+    for nRows in sizes:
+        previous = RegistrySnapshot.fromRows(generateSnapshot(nRows, nValuesPerKey))
+        current = RegistrySnapshot.fromRows(churnSnapshot(generateSnapshot(nRows, nValuesPerKey), fChurn))
+        start = time.perf_counter()
+        changes = app.checkChanges(previous, current)
+        metrics = {"changes": len(changes), "indexed_s": time.perf_counter() - start}
+        if nRows <= nLegacyLimit:
+            start = time.perf_counter()
+            legacy = legacyCheckChanges([previous.row(pos) for pos in range(len(previous))], [current.row(pos) for pos in range(len(current))])
+            metrics["legacy_s"] = time.perf_counter() - start
+            assert changes.to_dict('records') == legacy, "indexed diff disagrees with legacy diff"
+        recordResult("checkChanges", {"rows": nRows, "churn": fChurn, "values_per_key": nValuesPerKey}, metrics)
+
+def benchSnapshotMemory(nRows):
+    # Live memory of the whole snapshot in each layout, each built from scratch so shared strings are counted once
+    tracemalloc.start()
+    rows = generateSnapshot(nRows)
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    del rows
+    tracemalloc.stop()
+    tracemalloc.start()
+    snapshot = generateColumnarSnapshot(nRows)
+    columnar_bytes = tracemalloc.get_traced_memory()[0]
+    del snapshot
+    tracemalloc.stop()
+    recordResult("snapshotMemory", {"rows": nRows}, {"dicts_mib": dict_bytes / 2**20, "columnar_mib": columnar_bytes / 2**20})
+
+def benchBaselineStore(nRows):
+    # Saving a baseline version and reloading it after a restart, compared with re-reading it from a full CSV export
+    snapshot = generateColumnarSnapshot(nRows)
+    with tempfile.TemporaryDirectory() as sTempDir:
+        path = os.path.join(sTempDir, "baseline.parsnap")
+        start = time.perf_counter()
+        snapshot.save(path)
+        save = time.perf_counter() - start
+        start = time.perf_counter()
+        loaded = RegistrySnapshot.load(path)
+        load = time.perf_counter() - start
+        assert (loaded.rowHashes() == snapshot.rowHashes()).all() and (loaded.xValues == snapshot.xValues).all(), "baseline round trip changed the snapshot"
+        csv_path = os.path.join(sTempDir, "baseline.csv")
+        snapshot.toFrame().to_csv(csv_path, index=False)
+        start = time.perf_counter()
+        RegistrySnapshot.fromRows(pd.read_csv(csv_path, dtype=str, keep_default_na=False).to_dict('records'))
+        csv_load = time.perf_counter() - start
+        recordResult("baselineStore", {"rows": nRows}, {"file_mib": os.path.getsize(path) / 2**20, "save_s": save, "load_s": load, "csv_load_s": csv_load})
+
+def benchSearch(nRows):
+    # Index build and one search per mode, each checked against a plain per-row scan of the same rows
+    snapshot = generateColumnarSnapshot(nRows)
+    frame = snapshot.toFrame()
+    start = time.perf_counter()
+    index = SearchIndex(snapshot)
+    metrics = {"build_s": time.perf_counter() - start}
+    cases = [
+        ("substring", "Substring", "vendor12"),
+        ("prefix", "Prefix", "root\\software\\vendor5"),
+        ("regex", "Regex", "runonce|proxyenable"),
+        # Anchors and lookarounds must apply to each string, not to the index's joined blob
+        ("anchored", "Regex", r"\Aroot\\software\\vendor1\d\\|key1\d\Z|(?<!\w)run"),
+    ]
+    for sName, sMode, kw in cases:
+        start = time.perf_counter()
+        positions = index.search(kw, sMode)
+        metrics[f"{sName}_s"] = time.perf_counter() - start
+        if sMode == "Regex":
+            expected = np.zeros(len(frame), dtype=bool)
+            for field in ("Key", "Name", "Value"):
+                expected |= frame[field].str.contains(kw, case=False, regex=True).to_numpy()
+        elif sMode == "Prefix":
+            expected = np.logical_or.reduce([frame[field].str.lower().str.lstrip('\\').str.startswith(kw.lstrip('\\')).to_numpy() for field in ("Key", "Name", "Value")])
+        else:
+            expected = np.logical_or.reduce([frame[field].str.lower().str.contains(kw, regex=False).to_numpy() for field in ("Key", "Name", "Value")])
+        assert positions.tolist() == np.flatnonzero(expected).tolist(), f"{sMode} search for {kw!r} disagrees with a per-row scan"
+        metrics[f"{sName}_rows"] = len(positions)
+    recordResult("search", {"rows": nRows}, metrics)
+
+def benchExportPipeline(nRows, nEntryLimit):
+    # Peak traced memory and time of preprocessAndExport: the old preprocess-everything-then-head() path vs batches
+    snapshot = generateColumnarSnapshot(nRows)
+    with tempfile.TemporaryDirectory() as sTempDir:
+        app = PARSNIPMonitor()
+        app.sOutputDir = sTempDir
+        app.nEntryLimit = nEntryLimit
+        tracemalloc.start()
+        start = time.perf_counter()
+        app.preprocessData(snapshot.toFrame(), bFitScalers=True).head(nEntryLimit).to_csv(os.path.join(sTempDir, "legacy.csv"), index=False)
+        legacy = time.perf_counter() - start
+        legacy_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        app = PARSNIPMonitor()
+        app.sOutputDir = sTempDir
+        app.nEntryLimit = nEntryLimit
+        tracemalloc.start()
+        start = time.perf_counter()
+        app.preprocessAndExport(snapshot)
+        streamed = time.perf_counter() - start
+        streamed_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        recordResult("exportPipeline", {"rows": nRows, "entry_limit": nEntryLimit},
+                     {"legacy_s": legacy, "legacy_peak_mib": legacy_peak / 2**20, "streamed_s": streamed, "streamed_peak_mib": streamed_peak / 2**20})
+
+def describeEnvironment():
+    try:
+        sVersion = subprocess.run(["git", "describe", "--always", "--dirty"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                  capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        sVersion = None
+    return {
+        "version": sVersion,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "packages": {module.__name__: module.__version__ for module in (np, pd, sklearn, joblib, regipy)}
+    }
+
+def compareResults(sPath, fMaxRegression=None):
+    # Time and memory ratios against an earlier --json report, matched on benchmark name and parameters
+    with open(sPath, encoding='utf-8') as f:
+        old = json.load(f)
+    previous = {(result["benchmark"], json.dumps(result["params"], sort_keys=True)): result["metrics"] for result in old["results"]}
+    print(f"Compared with {old['meta']['version']} ({sPath}); ratios above 1 are slower or larger")
+    xRegressions = []
+    for result in xResults:
+        before = previous.get((result["benchmark"], json.dumps(result["params"], sort_keys=True)))
+        if before is None:
+            continue
+        ratios = {sName: value / before[sName] for sName, value in result["metrics"].items()
+                  if sName.endswith(("_s", "_mib")) and not sName.endswith("_per_s") and before.get(sName)}
+        if ratios:
+            params = " ".join(f"{sName}={value}" for sName, value in result["params"].items())
+            print(f"{result['benchmark']} {params} " + " ".join(f"{sName}={ratio:.2f}x" for sName, ratio in ratios.items()))
+        if fMaxRegression is not None:
+            xRegressions += [(result["benchmark"], sName) for sName, ratio in ratios.items() if ratio > fMaxRegression]
+    return xRegressions
+
+# Benchmark name -> runner; --only picks a subset
+xBenchmarks = {
+    "startup": lambda args: benchStartup(args.startup_runs),
+    "checkChanges": lambda args: benchCheckChanges(args.sizes, args.legacy_limit, args.churn_rate, args.values_per_key),
+    "preprocessData": lambda args: benchPreprocessData(args.preprocess_rows),
+    "classifyChanges": lambda args: benchClassifyChanges(args.classify_rows, args.churn_rate, args.values_per_key),
+    "inference": lambda args: benchInference(args.inference_rows),
+    "eventSink": lambda args: benchEventSink(args.classify_rows),
+    "csvWriters": lambda args: benchCsvWriters(args.csv_rows),
+    "snapshotMemory": lambda args: benchSnapshotMemory(args.memory_rows),
+    "baselineStore": lambda args: benchBaselineStore(args.memory_rows),
+    "search": lambda args: benchSearch(args.search_rows),
+    "exportPipeline": lambda args: [benchExportPipeline(args.memory_rows, nEntryLimit) for nEntryLimit in args.export_limits],
+    "parseRegistry": lambda args: [benchParseRegistry(nKeys, getChurnKeys(args, nKeys), args.depth, args.values_per_key) for nKeys in args.hive_keys],
+    "unchangedTick": lambda args: [benchUnchangedTick(nKeys, getChurnKeys(args, nKeys), args.depth, args.values_per_key) for nKeys in args.hive_keys],
+    "deltaExport": lambda args: benchDeltaExport(args.hive_keys[0], args.delta_ticks, getChurnKeys(args, args.hive_keys[0]), args.depth, args.values_per_key),
+    "partitionedParse": lambda args: benchPartitionedParse(args.hive_keys[-1], args.parse_workers, args.split_depth),
+    "multiHive": lambda args: benchMultiHive(args.multi_hives, args.hive_keys[0], getChurnKeys(args, args.hive_keys[0]), args.depth, args.values_per_key)
+}
+
+# Sizes used by --quick, for a run of a minute or two
+xQuickDefaults = {
+    "sizes": [10_000], "preprocess_rows": 20_000, "memory_rows": 100_000, "export_limits": [100], "startup_runs": 2,
+    "inference_rows": 20_000, "classify_rows": 20_000, "csv_rows": 20_000, "search_rows": 100_000, "hive_keys": [1_000], "parse_workers": [1, 2], "multi_hives": 2,
+    "delta_ticks": 4
+}
+
+def getChurnKeys(args, nKeys):
+    return args.churn_keys if args.churn_keys is not None else max(1, round(nKeys * args.churn_rate))
+
+def main():
+    parser = argparse.ArgumentParser(description="PARSNIP performance benchmarks on synthetic snapshots and hive files")
+    parser.add_argument("--only", nargs='+', choices=list(xBenchmarks), help="Run only these benchmarks")
+    parser.add_argument("--quick", action="store_true", help="Small sizes for a fast smoke run")
+    parser.add_argument("--json", default='', help="Write the results, with versions and platform, to this JSON file")
+    parser.add_argument("--compare", default='', help="Print time and memory ratios against an earlier --json report")
+    parser.add_argument("--max-regression", type=float, default=None, help="With --compare, exit 1 if any ratio exceeds this")
+    parser.add_argument("--sizes", type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--legacy-limit", type=int, default=10_000, help="Largest size also timed with the quadratic reference")
+    parser.add_argument("--preprocess-rows", type=int, default=500_000)
+    parser.add_argument("--memory-rows", type=int, default=1_000_000)
+    parser.add_argument("--export-limits", type=int, nargs='+', default=[100, 100_000], help="Entry limits for the export pipeline benchmark")
+    parser.add_argument("--startup-runs", type=int, default=5, help="Fresh interpreters started per startup measurement (best is reported)")
+    parser.add_argument("--inference-rows", type=int, default=200_000, help="Changed rows classified by the inference benchmark")
+    parser.add_argument("--classify-rows", type=int, default=100_000, help="Snapshot rows whose churned changes are classified")
+    parser.add_argument("--csv-rows", type=int, default=200_000, help="Snapshot rows written by the CSV writer benchmark")
+    parser.add_argument("--search-rows", type=int, default=1_000_000, help="Snapshot rows indexed by the search benchmark")
+    parser.add_argument("--hive-keys", type=int, nargs='+', default=[2_000, 10_000])
+    parser.add_argument("--depth", type=int, default=3, help="Key tree depth of the synthetic hives")
+    parser.add_argument("--values-per-key", type=int, default=5)
+    parser.add_argument("--churn-rate", type=float, default=0.005, help="Fraction of keys (hives) or rows (snapshots) changed per tick")
+    parser.add_argument("--churn-keys", type=int, default=None, help="Keys rewritten per hive tick; overrides --churn-rate for hives")
+    parser.add_argument("--parse-workers", type=int, nargs='+', default=sorted({1, 2, 4, os.cpu_count() or 1}), help="Worker counts for the partitioned parse; the first is the baseline")
+    parser.add_argument("--delta-ticks", type=int, default=12, help="Monitor ticks written by the delta export benchmark")
+    parser.add_argument("--split-depth", type=int, default=1)
+    parser.add_argument("--multi-hives", type=int, default=4, help="Hives refreshed together by the multi-hive monitor")
+    args = parser.parse_args()
+    if args.quick:
+        for sName, value in xQuickDefaults.items():
+            if getattr(args, sName) == parser.get_default(sName):
+                setattr(args, sName, value)
+    # Some benchmarks classify without a model; keep its "model not found" errors out of the timings output
+    logging.getLogger("PARSNIP").setLevel(logging.CRITICAL)
+    for sName, runner in xBenchmarks.items():
+        if not args.only or sName in args.only:
+            runner(args)
+    if args.json:
+        report = {"meta": describeEnvironment(), "args": vars(args), "results": xResults}
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.json}")
+    if args.compare:
+        xRegressions = compareResults(args.compare, args.max_regression)
+        if xRegressions:
+            print("Regressions above " + f"{args.max_regression}x: " + ", ".join(f"{sBenchmark}.{sName}" for sBenchmark, sName in xRegressions))
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())